@@ -1,22 +1,70 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Flask, Response, render_template, request, send_file, jsonify
+import json
+import logging
 import os
+import threading
 from werkzeug.utils import secure_filename
-from base import ImageToDesmosConverter
+from cache import ResultCache, cache_key
+from conversion import (LOG_FORMAT, convert_upload, init_worker, lazy_export_names,
+                        parse_conversion_params, render_export, save_outputs)
+from jobs import JobQueue, QueueFull
+from monitoring import CONTENT_TYPE, ConverterMetrics
 import io
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend for matplotlib
 
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 5MB max file size (reduced for free tier)
-app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
 
 # Ensure directories exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
+# Cache of finished conversions, keyed by image bytes + parameters
+result_cache = ResultCache(
+    app.config['OUTPUT_FOLDER'],
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 200 * 1024 * 1024)),
+    max_age=int(os.environ.get('RESULT_CACHE_MAX_AGE', 24 * 3600)),
+    max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 500))
+)
+
+# Conversions run in worker processes; request threads only enqueue and poll
+convert_workers = int(os.environ.get('CONVERT_WORKERS', os.cpu_count() or 1))
+# Memory for cached pipeline stages, shared out between the workers
+stage_cache_bytes = int(os.environ.get('STAGE_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+job_queue = JobQueue(
+    max_workers=convert_workers,
+    max_pending=int(os.environ.get('CONVERT_MAX_PENDING', 4 * (os.cpu_count() or 1))),
+    initializer=init_worker,
+    initargs=(1, logging.INFO, stage_cache_bytes // convert_workers)
+)
+
+# Cache key -> id of the job currently producing that result. The guard
+# makes cache lookup, submit and insert one step; it is reentrant because a
+# job that finishes at once runs store_result inside submit
+inflight_jobs = {}
+inflight_guard = threading.RLock()
+
+# File name -> lock held while that lazy export is rendered
+render_locks = {}
+render_locks_guard = threading.Lock()
+
+# Each /jobs/<id>/events stream holds a server thread until its job ends;
+# capping them keeps threads free for /convert and status polling
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 4))
+event_streams = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+# Prometheus metrics served at /metrics
+metrics = ConverterMetrics()
+metrics.gauge('desmos_jobs_pending', 'Conversion jobs queued or running.', job_queue.pending)
+metrics.gauge('desmos_result_cache_entries', 'Conversions held in the result cache.',
+              lambda: result_cache.stats()['entries'])
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -38,134 +86,186 @@ def convert_image():
         return jsonify({'error': 'Invalid file type. Please upload PNG, JPG, or GIF'}), 400
     
     try:
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
         # Get parameters from request
-        manual_rotation = float(request.form.get('rotation', 0))
-        segment_size = int(request.form.get('segment_size', 5))
-        low_threshold = int(request.form.get('low_threshold', 30))
-        high_threshold = int(request.form.get('high_threshold', 100))
-        epsilon_factor = float(request.form.get('epsilon_factor', 0.0001))
-        min_contour_area = int(request.form.get('min_contour_area', 20))
-        blur_size = int(request.form.get('blur_size', 3))
-        contours_only = request.form.get('contours_only', 'false').lower() == 'true'
+        params = parse_conversion_params(request.form)
+        image_bytes = file.read()
+        metrics.upload_bytes.observe(len(image_bytes))
         
-        # Bilateral filter parameters
-        use_bilateral = request.form.get('use_bilateral', 'false').lower() == 'true'
-        bilateral_d = int(request.form.get('bilateral_d', 9))
-        bilateral_sigma_color = int(request.form.get('bilateral_sigma_color', 75))
-        bilateral_sigma_space = int(request.form.get('bilateral_sigma_space', 75))
-        
-        # NEW: Posterization parameters
-        use_posterize = request.form.get('use_posterize', 'false').lower() == 'true'
-        posterize_levels = int(request.form.get('posterize_levels', 4))
-        
-        # NEW: Morphology parameters
-        use_morphology = request.form.get('use_morphology', 'false').lower() == 'true'
-        morph_close = int(request.form.get('morph_close', 3))
-        morph_open = int(request.form.get('morph_open', 2))
-        
-        # DEBUG: Print what we received
-        print(f"\n{'='*60}")
-        print(f"PARAMETERS RECEIVED:")
-        print(f"  use_bilateral: {use_bilateral} (raw: '{request.form.get('use_bilateral', 'NOT SENT')}')")
-        print(f"  use_posterize: {use_posterize} (raw: '{request.form.get('use_posterize', 'NOT SENT')}')")
-        print(f"  posterize_levels: {posterize_levels}")
-        print(f"  use_morphology: {use_morphology} (raw: '{request.form.get('use_morphology', 'NOT SENT')}')")
-        print(f"  morph_close: {morph_close}, morph_open: {morph_open}")
-        print(f"{'='*60}\n")
-        
-        # Process image
-        converter = ImageToDesmosConverter(filepath)
-        converter.load_and_preprocess(manual_rotation=manual_rotation)
-        
-        # Apply posterization if requested
-        if use_posterize:
-            converter.posterize(levels=posterize_levels)
-        
-        converter.detect_edges(
-            low_threshold=low_threshold, 
-            high_threshold=high_threshold,
-            blur_size=blur_size, 
-            min_contour_area=min_contour_area,
-            use_bilateral=use_bilateral,
-            bilateral_d=bilateral_d,
-            bilateral_sigma_color=bilateral_sigma_color,
-            bilateral_sigma_space=bilateral_sigma_space
-        )
+        key = cache_key(image_bytes, params)
+        filename = secure_filename(file.filename)
         
-        # Apply morphological cleanup if requested
-        if use_morphology:
-            converter.clean_edges(close_kernel=morph_close, open_kernel=morph_open)
+        # Output names carry the cache key so entries never overwrite each other
+        base_filename = f"{os.path.splitext(filename)[0]}_{key[:12]}"
         
-        converter.simplify_contours(epsilon_factor=epsilon_factor)
+        def store_result(job):
+            try:
+                store_outputs(job)
+            finally:
+                # Only after the result is cached, so identical requests find one or the other
+                with inflight_guard:
+                    if inflight_jobs.get(key) == job['id']:
+                        del inflight_jobs[key]
         
-        # Generate output files - just pass filenames, base.py handles the output_dir
-        base_filename = os.path.splitext(filename)[0]
+        def store_outputs(job):
+            if job['error'] is None:
+                # Workers return the curves (or preview) in memory; the
+                # remaining exports are rendered by /download when requested
+                payload, files = job['result']
+                names = save_outputs(files, app.config['OUTPUT_FOLDER'])
+                job['result'] = (payload, names)
+                lazy_files = [] if params['contours_only'] else lazy_export_names(base_filename)
+                result_cache.put(key, payload, names, lazy_files=lazy_files)
+                metrics.observe_conversion(params, payload)
+            else:
+                metrics.observe_failure(params, cancelled=job['cancelled'])
         
-        if contours_only:
-            # Only export contours visualization
-            contours_file = f"{base_filename}_contours_only.png"
-            converter.export_contours_only(contours_file, show_original=True)
-            
-            # Get stats
-            total_contours = len(converter.contours)
-            total_points = sum(len(c) for c in converter.contours)
-            
-            # Clean up uploaded file
-            os.remove(filepath)
+        with inflight_guard:
+            # Identical image + parameters: serve the stored outputs
+            cached = result_cache.get(key)
+            if cached is not None:
+                metrics.conversions.inc(mode=metrics.mode(params), outcome='cached')
+                return jsonify(dict(cached, cached=True))
             
-            return jsonify({
-                'success': True,
-                'contours_only': True,
-                'output_image': f'/download/{contours_file}',
-                'total_contours': total_contours,
-                'total_points': total_points,
-                'message': f'Preview complete: {total_contours} contours detected with {total_points} points'
-            })
-        else:
-            # Full Desmos processing
-            converter.fit_curves_parametric(segment_size=segment_size)
+            # Same request already queued or running: hand back that job
+            job_id = inflight_jobs.get(key)
+            status = job_queue.status(job_id) if job_id else None
+            if status is not None and status['status'] in ('queued', 'running'):
+                return jsonify(job_response(job_id)), 202
             
-            desmos_file = f"{base_filename}_desmos.txt"
-            console_file = f"{base_filename}_console.txt"
-            output_png = f"{base_filename}_output.png"
+            logger.info(f"PARAMETERS RECEIVED: {params}")
+            try:
+                job_id = job_queue.submit(convert_upload, image_bytes, base_filename, params,
+                                          on_done=store_result)
+            except QueueFull:
+                response = jsonify({'error': 'Server is busy, please retry shortly'})
+                response.headers['Retry-After'] = '5'
+                return response, 429
             
-            converter.export_to_desmos_file(desmos_file)
-            converter.export_for_console(console_file)
-            converter.export_to_high_res_png(output_png, dpi=150)
-            
-            # Read console input for display - now read from outputs folder
-            console_path = os.path.join(app.config['OUTPUT_FOLDER'], console_file)
-            with open(console_path, 'r') as f:
-                console_input = f.read()
-            
-            # Get stats
-            total_curves = sum(len(eq['segments']) for eq in converter.equations)
-            
-            # Clean up uploaded file
-            os.remove(filepath)
-            
-            return jsonify({
-                'success': True,
-                'contours_only': False,
-                'console_input': console_input,
-                'output_image': f'/download/{output_png}',
-                'desmos_file': f'/download/{desmos_file}',
-                'console_file': f'/download/{console_file}',
-                'total_curves': total_curves,
-                'message': f'Successfully converted image with {total_curves} polynomial curves!'
-            })
+            inflight_jobs[key] = job_id
+        return jsonify(job_response(job_id)), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.after_request
+def count_errors(response):
+    if request.endpoint == 'convert_image' and response.status_code >= 400:
+        metrics.request_errors.inc(status=str(response.status_code))
+    return response
+
+def job_response(job_id):
+    return dict(job_queue.status(job_id),
+                status_url=f'/jobs/{job_id}',
+                result_url=f'/jobs/{job_id}/result',
+                events_url=f'/jobs/{job_id}/events',
+                cancel_url=f'/jobs/{job_id}/cancel')
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if status['status'] == 'cancelled':
+        return jsonify({'error': status.get('error', 'Job was cancelled')}), 410
+    if status['status'] == 'failed':
+        return jsonify({'error': status['error']}), 500
+    if status['status'] != 'done':
+        return jsonify(status), 202
+    payload, _ = job_queue.get(job_id)['result']
+    return jsonify(dict(payload, cached=False))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-sent events for a job: one ``stage`` event per pipeline stage
+    start/end, then a final ``done``, ``failed`` or ``cancelled`` event
+    carrying the job status.
+    
+    Events are numbered; a reconnecting client's ``Last-Event-ID`` resumes
+    after that event. At most MAX_EVENT_STREAMS streams are open at once,
+    further requests get 429 and should poll the status URL instead.
+    """
+    if job_queue.status(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not event_streams.acquire(blocking=False):
+        response = jsonify({'error': 'Too many progress streams, poll the job status instead'})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    def stream(seen):
+        while True:
+            events, finished = job_queue.wait_events(job_id, since=seen)
+            if events is None:
+                return
+            for event in events:
+                seen += 1
+                yield f"id: {seen}\nevent: stage\ndata: {json.dumps(event)}\n\n"
+            if finished:
+                status = job_queue.status(job_id)
+                yield f"id: {seen}\nevent: {status['status']}\ndata: {json.dumps(status)}\n\n"
+                return
+            if not events:
+                # Keep proxies from closing an idle connection
+                yield ": keepalive\n\n"
+    
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    seen = max(0, int(last_event_id)) if last_event_id.isdigit() else 0
+    response = Response(stream(seen), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also runs when the client disconnects before the stream starts
+    response.call_on_close(event_streams.release)
+    return response
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    if job_queue.status(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify(dict(job_queue.status(job_id), error='Job already finished')), 409
+    return jsonify(job_queue.status(job_id))
+
+@app.route('/jobs/stats')
+def jobs_stats():
+    return jsonify(job_queue.stats())
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+def render_lazy_export(filename, filepath):
+    """Render an export of a cached conversion on its first download (once across threads)."""
+    with render_locks_guard:
+        lock = render_locks.setdefault(filename, threading.Lock())
+    with lock:
+        if not os.path.exists(filepath):
+            try:
+                size = render_export(app.config['OUTPUT_FOLDER'], filename)
+            except OSError:
+                # Curves evicted meanwhile
+                size = None
+            if size is not None:
+                metrics.output_bytes.observe(size, mode='full')
+                if not result_cache.add_file(filename, size):
+                    os.remove(filepath)
+    with render_locks_guard:
+        render_locks.pop(filename, None)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     filepath = os.path.join(app.config['OUTPUT_FOLDER'], filename)
+    if not os.path.exists(filepath) and result_cache.owner(filename) is not None:
+        render_lazy_export(filename, filepath)
     if os.path.exists(filepath):
         return send_file(filepath, as_attachment=True)
     return jsonify({'error': 'File not found'}), 404
@@ -1,40 +1,206 @@
 import cv2
 import numpy as np
-from scipy.interpolate import splprep, splev, lagrange
+from scipy.interpolate import splprep, splev
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
 from pathlib import Path
-import json
+import hashlib
+import io
+import logging
+import time
 import urllib.parse
 
+from curves import CurveSet
+from budget import contour_significance, plan_budget, scale_costs, simplification_ladder
+from fitting import count_segments, fit_contours
+from exporters import (count_list_expressions, graph_state_skeleton, iter_console_commands,
+                       iter_console_list_commands, iter_desmos_text, iter_graph_state_expressions,
+                       iter_graph_state_json, iter_graph_state_list_expressions, iter_svg,
+                       write_stream)
+from formatting import CurveFormatter
+from instrumentation import PipelineMetrics
+from render import DEFAULT_BACKEND, check_backend, draw_on_axes, rasterize
+from resolution import IDENTITY_TRANSFORM, contours_to_image, downscale
+from skeleton import binarize, thin, trace_skeleton
+from stages import default_stage_cache, reported, stage
+from stitching import JOIN_ANGLE, OVERLAP_THRESHOLD, STROKE_DISTANCE, stitch
+from tiling import smooth, tiled_canny
+
+logger = logging.getLogger(__name__)
+
 class ImageToDesmosConverter:
-    def __init__(self, image_path):
+    def __init__(self, image_path, stage_cache=default_stage_cache, progress_callback=None,
+                 persist=True, name=None):
+        """
+        Parameters:
+        - image_path: The image to convert: a file path, the encoded file
+                      contents (bytes) or a decoded BGR/grayscale ndarray
+        - stage_cache: StageCache used to memoize pipeline stages
+                       (shared per process by default, None disables it)
+        - progress_callback: Called with an event dict at the start and end of
+                             every stage and export: stage, phase ('start' or
+                             'end'), elapsed_ms, contours, segments. Raising
+                             from it aborts the conversion.
+        - persist: Write exports (and a copy of the input) to ``output_dir``.
+                   When False nothing touches the disk; exports are kept
+                   in ``self.outputs`` as bytes, keyed by file name.
+        - name: Base name of the output files (default: the file stem,
+                'image' for in-memory input)
+        """
         self.image_path = image_path
+        self.persist = persist
+        self.outputs = {}
         self.image = None
         self.gray = None
         self.edges = None
         self.contours = []
-        self.equations = []
+        # False once contours are open polylines (after stitch_contours)
+        self.closed_contours = True
+        self.working_transform = IDENTITY_TRANSFORM
+        self.curves = CurveSet.empty()
+        self._formatter = None
         self.output_dir = Path("outputs")
-        self.base_name = None
+        if name is None:
+            name = Path(image_path).stem if isinstance(image_path, (str, Path)) else 'image'
+        self.base_name = name
+        self.stage_cache = stage_cache
+        self._stage_key = None
+        self._source = None
+        self.progress_callback = progress_callback
+        self._started = time.perf_counter()
+        # Per-stage timing, memory and counts (see instrumentation.py)
+        self.metrics = PipelineMetrics()
+        self._bytes_written = 0
     
-    def load_and_preprocess(self, auto_rotate=True, manual_rotation=0, enhance_contrast=True):
-        self.image = cv2.imread(str(self.image_path))
-        if self.image is None:
-            raise ValueError(f"Could not load image from {self.image_path}")
+    def _counts(self):
+        return {
+            'pixels': 0 if self.gray is None else int(self.gray.size),
+            'contours': len(self.contours),
+            'points': sum(len(c) for c in self.contours),
+            'segments': len(self.curves),
+            'bytes_written': self._bytes_written,
+        }
+    
+    def _written(self, filename):
+        """Count an output file towards the current step's bytes_written."""
+        self._bytes_written += Path(filename).stat().st_size
+    
+    def _emit(self, filename, data):
+        """
+        Store an export: ``data`` is bytes or an iterable of text chunks.
+        
+        Written to ``output_dir / filename`` when persisting (text is
+        streamed), otherwise kept in ``self.outputs[filename]``. Returns
+        where it went, for log messages.
+        """
+        if self.persist:
+            path = self.output_dir / filename
+            if isinstance(data, bytes):
+                path.write_bytes(data)
+            else:
+                write_stream(data, path)
+            self._written(path)
+            return path
+        if not isinstance(data, bytes):
+            data = ''.join(data).encode()
+        self.outputs[Path(filename).name] = data
+        self._bytes_written += len(data)
+        return f"memory:{Path(filename).name}"
+    
+    def _emit_figure(self, filename, **savefig_options):
+        """Save the current matplotlib figure through ``_emit`` and close it."""
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format=Path(filename).suffix[1:] or 'png', **savefig_options)
+        plt.close()
+        return self._emit(filename, buffer.getvalue())
+    
+    def _report(self, stage, phase, **extra):
+        """Record metrics for a stage/export start or end and pass the event on."""
+        if phase == 'start':
+            self.metrics.start(stage, self._bytes_written)
+        else:
+            self.metrics.end(stage, self._counts(), cached=extra.get('cached'))
+        if self.progress_callback is None:
+            return
+        event = {
+            'stage': stage,
+            'phase': phase,
+            'elapsed_ms': round((time.perf_counter() - self._started) * 1000),
+            'contours': len(self.contours),
+            'segments': len(self.curves)
+        }
+        event.update(extra)
+        self.progress_callback(event)
+    
+    def load_and_preprocess(self, auto_rotate=True, manual_rotation=0, enhance_contrast=True,
+                            max_working_pixels=None):
+        """
+        Load the image and prepare the grayscale working copy.
         
-        # Extract base name from input image path
-        self.base_name = Path(self.image_path).stem
+        Parameters:
+        - max_working_pixels: Process a downscaled copy with at most this many
+                              pixels (default: native resolution). Contours
+                              stay in working coordinates; fitted curves and
+                              exports are mapped back to the original size.
+        """
+        self._started = time.perf_counter()
+        source = self.image_path
+        if isinstance(source, np.ndarray):
+            # Stage keys chain from the image content, not its path
+            digest = hashlib.sha256(f"{source.shape}{source.dtype}".encode())
+            digest.update(np.ascontiguousarray(source).data)
+            self._stage_key = digest.hexdigest()
+        else:
+            if isinstance(source, (str, Path)):
+                try:
+                    source = Path(source).read_bytes()
+                except OSError:
+                    raise ValueError(f"Could not load image from {self.image_path}")
+            self._stage_key = hashlib.sha256(source).hexdigest()
+        self._source = source
+        try:
+            self._load()
+        finally:
+            self._source = None
+        
+        if self.persist:
+            # Create outputs directory if it doesn't exist
+            self.output_dir.mkdir(exist_ok=True)
+            
+            # Save original input image to outputs folder
+            input_copy_path = self.output_dir / f"{self.base_name}_input.png"
+            cv2.imwrite(str(input_copy_path), self.image)
+            self._written(input_copy_path)
+            logger.info(f"✓ Saved input image to {input_copy_path}")
         
-        # Create outputs directory if it doesn't exist
-        self.output_dir.mkdir(exist_ok=True)
+        self._preprocess(manual_rotation=manual_rotation, enhance_contrast=enhance_contrast)
         
-        # Save original input image to outputs folder
-        input_copy_path = self.output_dir / f"{self.base_name}_input.png"
-        cv2.imwrite(str(input_copy_path), self.image)
-        print(f"✓ Saved input image to {input_copy_path}")
+        logger.info(f"✓ Loaded {self.gray.shape[1]}×{self.gray.shape[0]} image")
         
+        self.working_transform = IDENTITY_TRANSFORM
+        if max_working_pixels and self.gray.size > max_working_pixels:
+            self._downscale(max_working_pixels=max_working_pixels)
+        return self
+    
+    @stage('load', outputs=('image',))
+    def _load(self):
+        if isinstance(self._source, np.ndarray):
+            image = self._source
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            elif image.shape[2] == 4:
+                image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+            self.image = image.copy() if image is self._source else image
+            return self
+        self.image = cv2.imdecode(np.frombuffer(self._source, np.uint8), cv2.IMREAD_COLOR)
+        if self.image is None:
+            source = self.image_path if isinstance(self.image_path, (str, Path)) else 'memory'
+            raise ValueError(f"Could not load image from {source}")
+        return self
+    
+    @stage('preprocess', outputs=('image', 'gray'))
+    def _preprocess(self, manual_rotation=0, enhance_contrast=True):
         self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
         
         if enhance_contrast:
@@ -44,11 +210,22 @@ class ImageToDesmosConverter:
         if manual_rotation != 0:
             self.gray = self._rotate_image(self.gray, manual_rotation)
             self.image = self._rotate_image(self.image, manual_rotation)
-            print(f" Rotated {manual_rotation:.1f}°")
-        
-        print(f"✓ Loaded {self.gray.shape[1]}×{self.gray.shape[0]} image")
+            logger.info(f" Rotated {manual_rotation:.1f}°")
+        return self
+    
+    @stage('downscale', outputs=('gray', 'working_transform'))
+    def _downscale(self, max_working_pixels):
+        self.gray, self.working_transform = downscale(self.gray, max_working_pixels)
+        logger.info(f"✓ Working at {self.gray.shape[1]}×{self.gray.shape[0]} "
+              f"(1/{self.working_transform[0]:.2f} scale)")
         return self
     
+    @property
+    def image_contours(self):
+        """``self.contours`` in original image coordinates."""
+        return contours_to_image(self.contours, self.working_transform)
+    
+    @stage('posterize', outputs=('gray',))
     def posterize(self, levels=4):
         """
         Reduce gray levels to simplify gradients and reduce noise.
@@ -58,12 +235,12 @@ class ImageToDesmosConverter:
                  Lower = more aggressive simplification
         """
         if levels < 2 or levels > 16:
-            print(f" Warning: levels should be between 2-16, got {levels}")
+            logger.warning(f"levels should be between 2-16, got {levels}")
             levels = max(2, min(16, levels))
         
         step = 256 // levels
         self.gray = (self.gray // step) * step
-        print(f"✓ Posterized to {levels} gray levels (step={step})")
+        logger.info(f"✓ Posterized to {levels} gray levels (step={step})")
         return self
     
     def _rotate_image(self, img, angle):
@@ -76,9 +253,11 @@ class ImageToDesmosConverter:
                                  borderValue=(255, 255, 255))
         return rotated
     
+    @stage('edges', outputs=('edges', 'contours', 'closed_contours'))
     def detect_edges(self, low_threshold=30, high_threshold=100, 
                      blur_size=3, min_contour_area=20, use_bilateral=False,
-                     bilateral_d=9, bilateral_sigma_color=75, bilateral_sigma_space=75):
+                     bilateral_d=9, bilateral_sigma_color=75, bilateral_sigma_space=75,
+                     tile_size=None, tile_workers=None):
         """
         Detect edges using Canny edge detection.
         
@@ -87,40 +266,81 @@ class ImageToDesmosConverter:
         - bilateral_d: Diameter of pixel neighborhood (default: 9)
         - bilateral_sigma_color: Filter sigma in color space (default: 75)
         - bilateral_sigma_space: Filter sigma in coordinate space (default: 75)
+        - tile_size: Smooth and run Canny on overlapping tiles of this size in
+                     a thread pool when the image is larger (default: off).
+                     The edge map is identical to the untiled one.
+        - tile_workers: Threads for tiled mode (default: CPU count)
+        
+        min_contour_area is measured in original image pixels, also when
+        working on a downscaled copy.
         """
+        smoothing = dict(blur_size=blur_size, use_bilateral=use_bilateral, bilateral_d=bilateral_d,
+                         bilateral_sigma_color=bilateral_sigma_color,
+                         bilateral_sigma_space=bilateral_sigma_space)
+        
+        if tile_size and max(self.gray.shape) > tile_size:
+            self.edges = tiled_canny(self.gray, low_threshold, high_threshold,
+                                     tile_size=tile_size, workers=tile_workers, **smoothing)
+            logger.info(f" Processed edges in {tile_size}x{tile_size} tiles")
+        else:
+            self.edges = cv2.Canny(smooth(self.gray, **smoothing), low_threshold, high_threshold)
         
         if use_bilateral:
             # Edge-preserving bilateral filter
-            blurred = cv2.bilateralFilter(
-                self.gray, 
-                d=bilateral_d,
-                sigmaColor=bilateral_sigma_color,
-                sigmaSpace=bilateral_sigma_space
-            )
-            print(f" Applied bilateral filter (d={bilateral_d}, σ_color={bilateral_sigma_color}, σ_space={bilateral_sigma_space})")
+            logger.info(f" Applied bilateral filter (d={bilateral_d}, σ_color={bilateral_sigma_color}, σ_space={bilateral_sigma_space})")
         elif blur_size > 0:
             # Standard Gaussian blur
-            blurred = cv2.GaussianBlur(self.gray, (blur_size, blur_size), 0)
-            print(f" Applied Gaussian blur (kernel={blur_size}x{blur_size})")
+            logger.info(f" Applied Gaussian blur (kernel={blur_size}x{blur_size})")
         else:
-            blurred = self.gray
-            print(" No blur applied")
-        
-        self.edges = cv2.Canny(blurred, low_threshold, high_threshold)
+            logger.info(" No blur applied")
         
         contours, _ = cv2.findContours(self.edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        self.contours = [c for c in contours if cv2.contourArea(c) > min_contour_area]
+        # min_contour_area is in original image pixels
+        sx, _, sy, _ = self.working_transform
+        min_area = min_contour_area / (sx * sy)
+        self.contours = [c for c in contours if cv2.contourArea(c) > min_area]
+        self.closed_contours = True
+        
+        logger.info(f"✓ Found {len(self.contours)} contours (min_area={min_contour_area})")
+        return self
+    
+    @stage('skeleton', outputs=('edges', 'contours', 'closed_contours'))
+    def detect_skeleton(self, threshold=None, blur_size=3, min_length=10, join_angle=JOIN_ANGLE):
+        """
+        Extract stroke centerlines instead of edges (for line art).
         
-        print(f"✓ Found {len(self.contours)} contours (min_area={min_contour_area})")
+        The image is thresholded into stroke pixels, thinned to a 1-pixel
+        skeleton and traced into open polylines (see skeleton.py), so each
+        pen stroke gives one contour instead of Canny's two. Use in place of
+        detect_edges; simplify_contours and fit_curves_parametric follow as usual.
+        
+        Parameters:
+        - threshold: Gray level below which pixels are strokes
+                     (default: Otsu's threshold)
+        - blur_size: Gaussian blur before thresholding (0 = none)
+        - min_length: Drop strokes shorter than this many original image
+                      pixels (spurs and specks)
+        - join_angle: Max turn in degrees when joining strokes through a
+                      junction (0 disables joining)
+        """
+        self.edges = thin(binarize(self.gray, threshold, blur_size))
+        sx = self.working_transform[0]
+        self.contours = trace_skeleton(self.edges, min_length / sx, join_angle)
+        self.closed_contours = False
+        
+        logger.info(f"✓ Traced {len(self.contours)} strokes from the skeleton (min_length={min_length})")
         return self
     
-    def clean_edges(self, close_kernel=3, open_kernel=2):
+    @stage('morphology', outputs=('edges', 'contours', 'closed_contours'))
+    def clean_edges(self, close_kernel=3, open_kernel=2, min_contour_area=20):
         """
         Apply morphological operations to clean edge map.
         
         Parameters:
         - close_kernel: Size of kernel for closing (connects nearby edges)
         - open_kernel: Size of kernel for opening (removes small specks)
+        - min_contour_area: Drop contours enclosing less than this, in
+                            original image pixels (as in detect_edges)
         """
         close_k = np.ones((close_kernel, close_kernel), np.uint8)
         open_k = np.ones((open_kernel, open_kernel), np.uint8)
@@ -134,377 +354,281 @@ class ImageToDesmosConverter:
         # Re-find contours after cleanup
         contours, _ = cv2.findContours(self.edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
         old_count = len(self.contours)
-        self.contours = [c for c in contours if cv2.contourArea(c) > 20]
+        sx, _, sy, _ = self.working_transform
+        min_area = min_contour_area / (sx * sy)
+        self.contours = [c for c in contours if cv2.contourArea(c) > min_area]
+        self.closed_contours = True
         
-        print(f"✓ Cleaned edges: {old_count} → {len(self.contours)} contours")
+        logger.info(f"✓ Cleaned edges: {old_count} → {len(self.contours)} contours")
         return self
     
+    @stage('stitch', outputs=('contours', 'closed_contours'))
+    def stitch_contours(self, stroke_distance=STROKE_DISTANCE, overlap_threshold=OVERLAP_THRESHOLD,
+                        join_angle=JOIN_ANGLE):
+        """
+        Merge and deduplicate contours into open strokes (see stitching.py).
+        
+        Double-traced edges are kept once, touching contours that continue
+        each other are joined, and contours running along longer ones are
+        dropped in favour of a centerline. Run after detect_edges, clean_edges
+        or detect_skeleton.
+        
+        Parameters:
+        - stroke_distance: Max distance in edge-map pixels between contours
+                           of one stroke (0 disables deduplication)
+        - overlap_threshold: Share of a contour near a longer one for it to
+                             be dropped (default: 0.8)
+        - join_angle: Max turn in degrees when joining contours through a
+                      junction (0 disables joining)
+        """
+        old_count = len(self.contours)
+        self.contours = stitch(self.contours, self.gray.shape, stroke_distance,
+                               overlap_threshold, join_angle, closed=self.closed_contours)
+        self.closed_contours = False
+        logger.info(f"✓ Stitched {old_count} contours into {len(self.contours)} strokes")
+        return self
+    
+    @stage('simplify', outputs=('contours',))
     def simplify_contours(self, epsilon_factor=0.0001):
         simplified = []
         for contour in self.contours:
-            epsilon = epsilon_factor * cv2.arcLength(contour, True)
-            approx = cv2.approxPolyDP(contour, epsilon, True)
+            epsilon = epsilon_factor * cv2.arcLength(contour, self.closed_contours)
+            approx = cv2.approxPolyDP(contour, epsilon, self.closed_contours)
             simplified.append(approx)
         
         self.contours = simplified
         new_total = sum(len(c) for c in self.contours)
-        print(f"Simplified to {new_total} points")
+        logger.info(f"Simplified to {new_total} points")
         return self
     
-    def fit_curves_parametric(self, segment_size=5):
-        self.equations = []
+    @stage('budget', outputs=('contours',))
+    def limit_expressions(self, max_expressions, segment_size=5, epsilon_factor=0.0001,
+                          tolerance=None, degree=None):
+        """
+        Coarsen and prune contours so fitting yields at most ``max_expressions`` segments.
         
-        for contour in self.contours:
-            if len(contour) < 2:
-                continue
-            
-            points = contour.reshape(-1, 2)
-            x = points[:, 0].astype(float)
-            y = points[:, 1].astype(float)
-            y = self.image.shape[0] - y
-            
-            n_points = len(x)
-            
-            if n_points <= segment_size:
-                t_points = np.linspace(0, 1, n_points)
-                try:
-                    poly_x = lagrange(t_points, x)
-                    poly_y = lagrange(t_points, y)
-                    
-                    self.equations.append({
-                        'segments': [{
-                            't_range': (0, 1),
-                            'poly_x': poly_x,
-                            'poly_y': poly_y
-                        }]
-                    })
-                except:
-                    pass
-                continue
-            
-            polynomial_segments = []
-            stride = max(1, segment_size - 2)
-            
-            for start_idx in range(0, n_points - segment_size + 1, stride):
-                end_idx = min(start_idx + segment_size, n_points)
-                
-                seg_x = x[start_idx:end_idx]
-                seg_y = y[start_idx:end_idx]
-                t_points = np.linspace(0, 1, len(seg_x))
-                
-                try:
-                    poly_x = lagrange(t_points, seg_x)
-                    poly_y = lagrange(t_points, seg_y)
-                    
-                    polynomial_segments.append({
-                        't_range': (start_idx / (n_points - 1), end_idx / (n_points - 1)),
-                        'poly_x': poly_x,
-                        'poly_y': poly_y
-                    })
-                except:
-                    continue
-            
-            if len(polynomial_segments) > 0:
-                self.equations.append({'segments': polynomial_segments})
+        Contours are ranked by significance (length, area, edge contrast);
+        the least significant are dropped and the rest are simplified with a
+        larger tolerance, whichever keeps more of the image (see budget.py).
+        Run after simplify_contours with the same segment_size, tolerance and
+        degree as the fit.
+        """
+        height = self.gray.shape[0]
+        counts = count_segments(self.contours, height, segment_size, tolerance, degree)
+        if counts.sum() <= max_expressions:
+            return self
+        
+        ladder = simplification_ladder(self.contours, epsilon_factor, closed=self.closed_contours)
+        scores = contour_significance(self.contours, self.gray, closed=self.closed_contours)
+        if tolerance is None:
+            costs = [count_segments(level, height, segment_size, tolerance, degree) for level in ladder]
+        else:
+            # Counting adaptive segments means fitting: count the finest and
+            # coarsest levels and interpolate the others along fixed-window counts
+            costs = scale_costs([count_segments(level, height, segment_size, None, degree)
+                                 for level in ladder], counts,
+                                count_segments(ladder[-1], height, segment_size, tolerance, degree))
+        level, keep = plan_budget(costs, scores, max_expressions)
+        if tolerance is not None:
+            # Count a level exactly once it is chosen, until the plan's level is exact
+            exact = {0, len(ladder) - 1}
+            while level not in exact:
+                costs[level] = count_segments(ladder[level], height, segment_size, tolerance, degree)
+                exact.add(level)
+                level, keep = plan_budget(costs, scores, max_expressions)
+        
+        self.contours = [c for c, k in zip(ladder[level], keep) if k]
+        logger.info(f"✓ Expression budget {max_expressions}: kept {keep.sum()}/{len(keep)} contours "
+              f"at simplification level {level}, {costs[level][keep].sum()} segments "
+              f"(was {counts.sum()})")
+        return self
+    
+    @stage('fit', outputs=('curves',))
+    def fit_curves_parametric(self, segment_size=5, tolerance=None, degree=None):
+        """
+        Fit parametric polynomial segments to every contour.
+
+        All segments of all contours are interpolated in batched solves
+        (see fitting.py) and stored in ``self.curves``, in original image
+        coordinates.
+        
+        Parameters:
+        - segment_size: Interpolation points per segment (degree + 1), or
+                        points per least-squares window when degree is set
+        - tolerance: Max deviation in pixels. When set, segments grow
+                     adaptively until they would exceed it, instead of
+                     sliding fixed windows of segment_size points.
+        - degree: Fit least-squares polynomials of this fixed degree through
+                  each segment's endpoints instead of interpolating
+                  (independent of segment_size; 3 gives exact SVG Beziers)
+        """
+        height = self.gray.shape[0]
+        contour_index, t_ranges, coeffs_x, coeffs_y = fit_contours(
+            self.contours, height, segment_size, tolerance, degree)
+        self.curves = CurveSet(coeffs_x, coeffs_y, contour_index, t_ranges)
         
-        print(f"Generated {len(self.equations)} parametric curves")
+        if self.working_transform != IDENTITY_TRANSFORM:
+            # Fitted y is flipped (height - y); flip in working space, map, flip back
+            sx, ox, sy, oy = self.working_transform
+            self.curves = self.curves.affine(sx, ox, sy, self.image.shape[0] - sy * height - oy)
+        
+        logger.info(f"Generated {self.curves.n_curves} parametric curves")
         return self
     
+    @property
+    def formatter(self):
+        """Shared CurveFormatter for ``self.curves``; caches rendered expressions across exporters."""
+        if self._formatter is None or self._formatter.curves is not self.curves:
+            self._formatter = CurveFormatter(self.curves)
+        return self._formatter
+    
+    @property
+    def equations(self):
+        """Legacy list-of-dicts view of ``self.curves`` (built on demand)."""
+        return self.curves.to_equations()
+    
+    @reported('export_desmos')
     def export_to_desmos_file(self, filename=None):
         if filename is None:
-            filename = self.output_dir / f"{self.base_name}_desmos.txt"
-        else:
-            filename = self.output_dir / filename
-            
-        with open(filename, 'w') as f:
-            f.write("=" * 80 + "\n")
-            f.write("DESMOS OUTPUT - Parametric Polynomial Equations\n")
-            f.write("=" * 80 + "\n\n")
-            
-            f.write("INSTRUCTIONS:\n")
-            f.write("1. Copy each pair of x(t) and y(t) equations below\n")
-            f.write("2. In Desmos, paste them into expression boxes\n")
-            f.write("3. Desmos will create parametric curves automatically\n\n")
-            f.write("=" * 80 + "\n\n")
-            
-            curve_num = 1
-            for eq in self.equations:
-                for seg_idx, poly_seg in enumerate(eq['segments'], 1):
-                    f.write(f"\n{'='*80}\n")
-                    f.write(f"CURVE {curve_num}\n")
-                    f.write(f"{'='*80}\n\n")
-                    
-                    poly_x = poly_seg['poly_x']
-                    poly_y = poly_seg['poly_y']
-                    
-                    coeffs_x = poly_x.coefficients
-                    coeffs_y = poly_y.coefficients
-                    
-                    f.write("x(t) = ")
-                    terms_x = []
-                    degree = len(coeffs_x) - 1
-                    for i, coeff in enumerate(coeffs_x):
-                        power = degree - i
-                        if abs(coeff) > 1e-10:
-                            if power == 0:
-                                terms_x.append(f"{coeff:.4f}")
-                            elif power == 1:
-                                terms_x.append(f"{coeff:.4f}*t")
-                            else:
-                                terms_x.append(f"{coeff:.4f}*t^{power}")
-                    
-                    x_equation = " + ".join(terms_x).replace("+ -", "- ")
-                    f.write(x_equation + "\n\n")
-                    
-                    f.write("y(t) = ")
-                    terms_y = []
-                    degree = len(coeffs_y) - 1
-                    for i, coeff in enumerate(coeffs_y):
-                        power = degree - i
-                        if abs(coeff) > 1e-10:
-                            if power == 0:
-                                terms_y.append(f"{coeff:.4f}")
-                            elif power == 1:
-                                terms_y.append(f"{coeff:.4f}*t")
-                            else:
-                                terms_y.append(f"{coeff:.4f}*t^{power}")
-                    
-                    y_equation = " + ".join(terms_y).replace("+ -", "- ")
-                    f.write(y_equation + "\n\n")
-                    f.write("Domain: {0 ≤ t ≤ 1}\n\n")
-                    
-                    curve_num += 1
-        
-        print(f"Exported {curve_num-1} polynomial segments to {filename}")
+            filename = f"{self.base_name}_desmos.txt"
+        
+        filename = self._emit(filename, iter_desmos_text(self.formatter))
+        
+        logger.info(f"Exported {len(self.curves)} polynomial segments to {filename}")
         return self
 
-    def export_for_console(self, filename=None):
-        """Exports all expressions into a single command for the Desmos console."""
+    @reported('export_console')
+    def export_for_console(self, filename=None, lists=False):
+        """
+        Exports all expressions into a single command for the Desmos console.
+        
+        Parameters:
+        - lists: Pack segments of equal degree into coefficient lists, one
+                 expression per degree instead of one per segment
+        """
         
         if filename is None:
-            filename = self.output_dir / f"{self.base_name}_console.txt"
-        else:
-            filename = self.output_dir / filename
-        
-        # Start with a command to clear the calculator
-        all_expressions_str = "Calc.setBlank();\n"
-        
-        # Add each expression
-        curve_id = 1
-        for eq in self.equations:
-            for poly_seg in eq['segments']:
-                poly_x = poly_seg['poly_x']
-                poly_y = poly_seg['poly_y']
-                
-                coeffs_x = poly_x.coefficients
-                coeffs_y = poly_y.coefficients
-                
-                # Build x(t) equation string
-                terms_x = []
-                degree = len(coeffs_x) - 1
-                for i, coeff in enumerate(coeffs_x):
-                    power = degree - i
-                    if abs(coeff) > 1e-10:
-                        if power == 0:
-                            terms_x.append(f"{coeff:.6f}")
-                        elif power == 1:
-                            terms_x.append(f"{coeff:.6f}t")
-                        else:
-                            terms_x.append(f"{coeff:.6f}t^{{{power}}}")
-                x_latex = "+".join(terms_x).replace("+-", "-")
-                
-                # Build y(t) equation string
-                terms_y = []
-                degree = len(coeffs_y) - 1
-                for i, coeff in enumerate(coeffs_y):
-                    power = degree - i
-                    if abs(coeff) > 1e-10:
-                        if power == 0:
-                            terms_y.append(f"{coeff:.6f}")
-                        elif power == 1:
-                            terms_y.append(f"{coeff:.6f}t")
-                        else:
-                            terms_y.append(f"{coeff:.6f}t^{{{power}}}")
-                y_latex = "+".join(terms_y).replace("+-", "-")
-                
-                # Escape backslashes and quotes for the JavaScript string
-                latex_str = f"\\\\left({x_latex},{y_latex}\\\\right)"
-                
-                # Create the Desmos API command for this expression
-                expression_cmd = f"""
-                Calc.setExpression({{
-                  id: 'curve-{curve_id}',
-                  type: 'expression',
-                  latex: '{latex_str}',
-                  color: '#000000',
-                  lineWidth: '1',
-                  lineOpacity: '1',
-                  parametricDomain: {{ min: '0', max: '1' }}
-                }});
-                """
-                all_expressions_str += expression_cmd.strip() + "\n"
-                curve_id += 1
-        
-        with open(filename, 'w') as f:
-            f.write(all_expressions_str)
+            filename = f"{self.base_name}_console.txt"
+        
+        filename = self._emit(filename, self.iter_export('console', lists=lists))
             
-        print(f"Exported console commands to {filename}")
+        logger.info(f"Exported console commands to {filename}")
         return self
     
-    def create_desmos_graph_state(self):
-        """Create a Desmos graph state JSON that can be imported."""
-        expressions = []
-        
-        # Add a parameter slider for t
-        expressions.append({
-            "type": "expression",
-            "id": "t-slider",
-            "latex": "t=0.5",
-            "slider": {
-                "hardMin": True,
-                "hardMax": True,
-                "min": "0",
-                "max": "1",
-                "step": "0.01"
-            }
-        })
-        
-        curve_id = 1
-        for eq in self.equations:
-            for poly_seg in eq['segments']:
-                poly_x = poly_seg['poly_x']
-                poly_y = poly_seg['poly_y']
-                
-                coeffs_x = poly_x.coefficients
-                coeffs_y = poly_y.coefficients
-                
-                # Build x(t) equation string
-                terms_x = []
-                degree = len(coeffs_x) - 1
-                for i, coeff in enumerate(coeffs_x):
-                    power = degree - i
-                    if abs(coeff) > 1e-10:
-                        if power == 0:
-                            terms_x.append(f"{coeff:.6f}")
-                        elif power == 1:
-                            terms_x.append(f"{coeff:.6f}t_{{{curve_id}}}")
-                        else:
-                            terms_x.append(f"{coeff:.6f}t_{{{curve_id}}}^{{{power}}}")
-                
-                x_latex = "+".join(terms_x).replace("+-", "-")
-                
-                # Build y(t) equation string
-                terms_y = []
-                degree = len(coeffs_y) - 1
-                for i, coeff in enumerate(coeffs_y):
-                    power = degree - i
-                    if abs(coeff) > 1e-10:
-                        if power == 0:
-                            terms_y.append(f"{coeff:.6f}")
-                        elif power == 1:
-                            terms_y.append(f"{coeff:.6f}t_{{{curve_id}}}")
-                        else:
-                            terms_y.append(f"{coeff:.6f}t_{{{curve_id}}}^{{{power}}}")
-                
-                y_latex = "+".join(terms_y).replace("+-", "-")
-                
-                # Create parametric expression with unique parameter
-                expression = {
-                    "type": "expression",
-                    "id": f"curve-{curve_id}",
-                    "color": "#000000",
-                    "latex": f"\\left({x_latex},{y_latex}\\right)",
-                    "parametricDomain": {
-                        "min": "0",
-                        "max": "1"
-                    },
-                    "lineOpacity": "1",
-                    "lineWidth": "1"
-                }
-                expressions.append(expression)
-                curve_id += 1
-        
-        # Create the graph state
-        graph_state = {
-            "version": "9",
-            "graph": {
-                "viewport": {
-                    "xmin": str(-50),
-                    "ymin": str(-50),
-                    "xmax": str(self.image.shape[1] + 50),
-                    "ymax": str(self.image.shape[0] + 50)
-                }
-            },
-            "expressions": {
-                "list": expressions
-            }
-        }
+    def iter_export(self, fmt, compact=False, lists=False):
+        """
+        Stream an export as text chunks without building it in memory.
         
+        Parameters:
+        - fmt: 'desmos' (plain text), 'console' (Desmos console script)
+               or 'state' (graph-state JSON)
+        - compact: Write the graph-state JSON without whitespace
+        - lists: Use the list-based encoding for 'console' and 'state'
+                 (see exporters.list_groups)
+        """
+        if fmt == 'desmos':
+            return iter_desmos_text(self.formatter)
+        if fmt == 'console':
+            if lists:
+                return iter_console_list_commands(self.formatter)
+            return iter_console_commands(self.formatter)
+        if fmt == 'state':
+            height, width = self.image.shape[:2]
+            return iter_graph_state_json(self.formatter, width, height, compact=compact, lists=lists)
+        raise ValueError(f"Unknown export format '{fmt}'")
+    
+    def create_desmos_graph_state(self, lists=False):
+        """Create a Desmos graph state JSON that can be imported (``lists``: see iter_export)."""
+        height, width = self.image.shape[:2]
+        graph_state = graph_state_skeleton(width, height)
+        if lists:
+            expressions = iter_graph_state_list_expressions(self.formatter)
+        else:
+            expressions = iter_graph_state_expressions(self.formatter)
+        graph_state["expressions"]["list"].extend(expressions)
         return graph_state
     
-    def export_desmos_graph_state(self, filename=None):
-        """Export graph state to JSON file that can be imported to Desmos."""
+    @reported('export_state')
+    def export_desmos_graph_state(self, filename=None, compact=False, lists=False):
+        """
+        Export graph state to JSON file that can be imported to Desmos.
+        
+        Parameters:
+        - compact: Write minified JSON instead of indenting with 2 spaces
+        - lists: Pack segments of equal degree into coefficient lists
+        """
         if filename is None:
-            filename = self.output_dir / f"{self.base_name}_state.json"
-        else:
-            filename = self.output_dir / filename
-            
-        graph_state = self.create_desmos_graph_state()
+            filename = f"{self.base_name}_state.json"
         
-        with open(filename, 'w') as f:
-            json.dump(graph_state, f, indent=2)
+        filename = self._emit(filename, self.iter_export('state', compact=compact, lists=lists))
         
-        print(f" Exported Desmos graph state to {filename}")
-        print(f"  Total expressions: {len(graph_state['expressions']['list'])}")
+        total = count_list_expressions(self.curves) if lists else len(self.curves) + 1
+        logger.info(f" Exported Desmos graph state to {filename}")
+        logger.info(f"  Total expressions: {total}")
         return self
     
-    def export_to_svg(self, filename=None):
-        """Export curves as SVG (vector graphics) file."""
+    @reported('export_curves')
+    def export_curves(self, filename=None):
+        """
+        Store the fitted segments and image size as a compact ``.npz`` file,
+        from which the other exports can be rendered later (see
+        conversion.render_export).
+        """
         if filename is None:
-            filename = self.output_dir / f"{self.base_name}_output.svg"
-        else:
-            filename = self.output_dir / filename
+            filename = f"{self.base_name}_curves.npz"
+        
+        height, width = self.image.shape[:2]
+        buffer = io.BytesIO()
+        self.curves.save(buffer, size=np.array([width, height]))
+        filename = self._emit(filename, buffer.getvalue())
+        
+        logger.info(f"Stored {len(self.curves)} segments in {filename}")
+        return self
+    
+    @reported('export_svg')
+    def export_to_svg(self, filename=None, bezier=False):
+        """
+        Export curves as SVG (vector graphics) file.
+        
+        Parameters:
+        - bezier: Write segments as cubic Bezier commands instead of 50
+                  sampled points: exactly for degree <= 3, within
+                  exporters.BEZIER_TOLERANCE pixels for higher degrees
+        """
+        if filename is None:
+            filename = f"{self.base_name}_output.svg"
             
-        # Get image dimensions
         height, width = self.image.shape[:2]
+        filename = self._emit(filename, iter_svg(self.curves, width, height, bezier=bezier))
         
-        svg_lines = [
-            f'<?xml version="1.0" encoding="UTF-8"?>',
-            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
-            f'<rect width="{width}" height="{height}" fill="white"/>',
-            '<g stroke="black" stroke-width="1" fill="none">'
-        ]
-        
-        # Add each curve as a polyline
-        for eq in self.equations:
-            for seg in eq['segments']:
-                # Sample the polynomial
-                t_sample = np.linspace(0, 1, 50)
-                x_sample = seg['poly_x'](t_sample)
-                y_sample = seg['poly_y'](t_sample)
-                
-                # Create polyline points
-                points = " ".join([f"{x:.2f},{y:.2f}" for x, y in zip(x_sample, y_sample)])
-                svg_lines.append(f'<polyline points="{points}"/>')
-        
-        svg_lines.append('</g>')
-        svg_lines.append('</svg>')
-        
-        with open(filename, 'w') as f:
-            f.write('\n'.join(svg_lines))
-        
-        print(f"✓ Exported SVG to {filename}")
+        logger.info(f"✓ Exported SVG to {filename}")
         return self
     
-    def export_to_high_res_png(self, filename=None, dpi=300):
-        """Export curves as high-resolution PNG."""
+    @reported('export_png')
+    def export_to_high_res_png(self, filename=None, dpi=300, backend=DEFAULT_BACKEND):
+        """
+        Export curves as high-resolution PNG.
+        
+        Parameters:
+        - dpi: Output resolution; the image is rendered at width*dpi/100 pixels
+        - backend: 'opencv' (anti-aliased cv2.polylines, fastest), 'collection'
+                   (single matplotlib LineCollection) or 'matplotlib'
+                   (one ax.plot per segment)
+        """
+        check_backend(backend)
         if filename is None:
-            filename = self.output_dir / f"{self.base_name}_output.png"
-        else:
-            filename = self.output_dir / filename
+            filename = f"{self.base_name}_output.png"
             
         height, width = self.image.shape[:2]
         
+        if backend == 'opencv':
+            # 0.5pt line width, as in the matplotlib path
+            canvas = rasterize(self.curves, width, height, scale=dpi / 100,
+                               thickness=0.5 * dpi / 72)
+            filename = self._emit(filename, cv2.imencode('.png', canvas)[1].tobytes())
+            logger.info(f" Exported PNG to {filename}")
+            return self
+        
         # Create figure with exact dimensions
         fig, ax = plt.subplots(figsize=(width/100, height/100), dpi=dpi)
         ax.set_xlim(0, width)
@@ -514,24 +638,18 @@ class ImageToDesmosConverter:
         ax.axis('off')
         
         # Plot all curves
-        for eq in self.equations:
-            for seg in eq['segments']:
-                t_sample = np.linspace(0, 1, 50)
-                x_sample = seg['poly_x'](t_sample)
-                y_sample = seg['poly_y'](t_sample)
-                ax.plot(x_sample, y_sample, 'k-', linewidth=0.5)
-        
-        plt.savefig(filename, dpi=dpi, bbox_inches='tight', pad_inches=0, facecolor='white')
-        print(f" Exported PNG to {filename}")
-        plt.close()
+        draw_on_axes(ax, self.curves, backend=backend, color='k', linewidth=0.5)
+        
+        filename = self._emit_figure(filename, dpi=dpi, bbox_inches='tight', pad_inches=0,
+                                     facecolor='white')
+        logger.info(f" Exported PNG to {filename}")
         return self
     
+    @reported('export_contours')
     def export_contours_only(self, filename=None, show_original=True):
         """Export just the detected contours without polynomial fitting."""
         if filename is None:
-            filename = self.output_dir / f"{self.base_name}_contours_only.png"
-        else:
-            filename = self.output_dir / filename
+            filename = f"{self.base_name}_contours_only.png"
         
         # Create figure
         fig, axes = plt.subplots(1, 2 if show_original else 1, 
@@ -548,11 +666,11 @@ class ImageToDesmosConverter:
             contour_ax = axes
         
         # Create white background for contours
-        h, w = self.gray.shape
+        h, w = self.image.shape[:2]
         contour_image = np.ones((h, w, 3), dtype=np.uint8) * 255
         
         # Draw all contours
-        cv2.drawContours(contour_image, self.contours, -1, (0, 0, 0), 2)
+        cv2.polylines(contour_image, self.image_contours, self.closed_contours, (0, 0, 0), 2)
         
         contour_ax.imshow(contour_image)
         contour_ax.set_title(f'Detected Contours ({len(self.contours)} total)', 
@@ -560,14 +678,15 @@ class ImageToDesmosConverter:
         contour_ax.axis('off')
         
         plt.tight_layout()
-        plt.savefig(filename, dpi=150, bbox_inches='tight', facecolor='white')
-        print(f"Saved contours visualization to {filename}")
-        plt.close()
+        filename = self._emit_figure(filename, dpi=150, bbox_inches='tight', facecolor='white')
+        logger.info(f"Saved contours visualization to {filename}")
         
         return self
     
-    def visualize(self):
-        filename = self.output_dir / f"{self.base_name}_processing_steps.png"
+    @reported('visualize')
+    def visualize(self, backend=DEFAULT_BACKEND):
+        check_backend(backend)
+        filename = f"{self.base_name}_processing_steps.png"
         
         fig, axes = plt.subplots(1, 3, figsize=(18, 6))
         
@@ -581,19 +700,20 @@ class ImageToDesmosConverter:
         
         axes[2].set_aspect('equal')
         axes[2].set_title("Detected Curves")
-        axes[2].invert_yaxis()
         
-        for eq in self.equations:
-            for seg in eq['segments']:
-                t_sample = np.linspace(0, 1, 50)
-                x_sample = seg['poly_x'](t_sample)
-                y_sample = seg['poly_y'](t_sample)
-                axes[2].plot(x_sample, y_sample, 'b-', linewidth=0.5)
+        if backend == 'opencv':
+            # Unflipped raster: rows grow downward like the inverted axis below
+            height, width = self.image.shape[:2]
+            canvas = rasterize(self.curves, width, height, color=(255, 0, 0), flip_y=False)
+            axes[2].imshow(cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB))
+        else:
+            axes[2].invert_yaxis()
+            draw_on_axes(axes[2], self.curves, backend=backend, color='b', linewidth=0.5)
+            axes[2].autoscale_view()
         
         plt.tight_layout()
-        plt.savefig(filename, dpi=150, bbox_inches='tight')
-        print(f" Saved visualization to {filename}")
-        plt.close()
+        filename = self._emit_figure(filename, dpi=150, bbox_inches='tight')
+        logger.info(f" Saved visualization to {filename}")
         return self
     
     def process_preview_only(self, manual_rotation=0, low_threshold=30, 
@@ -601,11 +721,12 @@ class ImageToDesmosConverter:
                             min_contour_area=20, blur_size=3, use_bilateral=False,
                             bilateral_d=9, bilateral_sigma_color=75, bilateral_sigma_space=75,
                             use_posterize=False, posterize_levels=4,
-                            use_morphology=False, morph_close=3, morph_open=2):
+                            use_morphology=False, morph_close=3, morph_open=2,
+                            use_stitching=False):
         """Process image and show only contours without computing Desmos equations."""
-        print("\n" + "=" * 50)
-        print("🔍 Preview Mode - Contours Only")
-        print("=" * 50)
+        logger.info("=" * 50)
+        logger.info("🔍 Preview Mode - Contours Only")
+        logger.info("=" * 50)
         
         self.load_and_preprocess(manual_rotation=manual_rotation)
         
@@ -626,47 +747,69 @@ class ImageToDesmosConverter:
         
         # Apply morphological cleanup if requested
         if use_morphology:
-            self.clean_edges(close_kernel=morph_close, open_kernel=morph_open)
+            self.clean_edges(close_kernel=morph_close, open_kernel=morph_open,
+                             min_contour_area=min_contour_area)
+        
+        if use_stitching:
+            self.stitch_contours()
         
         self.simplify_contours(epsilon_factor=epsilon_factor)
         
         # Export contours visualization only
         self.export_contours_only(show_original=True)
         
-        print(f"✓ Preview complete - check contours image")
-        print(f"  Total contours: {len(self.contours)}")
+        logger.info(f"✓ Preview complete - check contours image")
+        logger.info(f"  Total contours: {len(self.contours)}")
         total_points = sum(len(c) for c in self.contours)
-        print(f"  Total points: {total_points}")
+        logger.info(f"  Total points: {total_points}")
         
         return self
     
     def process(self, output_file=None, manual_rotation=0, segment_size=5, 
                 export_svg=True, export_png=True, export_desmos_state=True,
-                contours_only=False):
+                contours_only=False, max_expressions=None, tolerance=None, degree=None,
+                use_stitching=False, edge_mode='canny'):
         """
         Full processing with all exports.
         
         Parameters:
         - contours_only: If True, only export contour visualization without Desmos equations
+        - max_expressions: Keep the number of curve expressions at or below
+                           this budget (see limit_expressions)
+        - tolerance: Fit adaptive segments within this many pixels
+                     (see fit_curves_parametric)
+        - degree: Least-squares fit degree (see fit_curves_parametric)
+        - use_stitching: Merge contours into single strokes before fitting
+                         (see stitch_contours)
+        - edge_mode: 'canny' for edge contours or 'skeleton' for stroke
+                     centerlines (see detect_skeleton)
         """
-        print("\n" + "=" * 50)
+        logger.info("=" * 50)
         if contours_only:
-            print("🔍 Contours Only Mode")
+            logger.info("🔍 Contours Only Mode")
         else:
-            print("🎨 Parametric Polynomial Converter")
-        print("=" * 50)
+            logger.info("🎨 Parametric Polynomial Converter")
+        logger.info("=" * 50)
         
         self.load_and_preprocess(manual_rotation=manual_rotation)
-        self.detect_edges()
+        if edge_mode == 'skeleton':
+            self.detect_skeleton()
+        else:
+            self.detect_edges()
+        if use_stitching:
+            self.stitch_contours()
         self.simplify_contours()
         
         if contours_only:
             # Only export contours visualization
             self.export_contours_only(show_original=True)
-            print(f"✓ Contours exported - {len(self.contours)} total contours")
+            logger.info(f"✓ Contours exported - {len(self.contours)} total contours")
         else:
             # Full Desmos processing
-            self.fit_curves_parametric(segment_size=segment_size)
+            if max_expressions:
+                self.limit_expressions(max_expressions, segment_size=segment_size,
+                                       tolerance=tolerance, degree=degree)
+            self.fit_curves_parametric(segment_size=segment_size, tolerance=tolerance, degree=degree)
             
             # Export in multiple formats
             self.export_to_desmos_file(output_file)
@@ -683,10 +826,12 @@ class ImageToDesmosConverter:
             
             self.visualize()
         
+        logger.info("Stage metrics:\n" + self.metrics.format_table())
         return self
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     converter = ImageToDesmosConverter("image.jpg")
     converter.process(manual_rotation=0, segment_size=5, 
                      export_svg=True, export_png=True, export_desmos_state=True)
@@ -0,0 +1,230 @@
+"""
+Batch conversion of image folders from the command line.
+
+Inputs are files, directories (searched recursively for images) or glob
+patterns. Every image is converted with the same parameters, given as a JSON
+file of web-form fields (``rotation``, ``low_threshold``, ``fit_tolerance``,
+``contours_only``, ...; see conversion.parse_conversion_params), so a batch
+run produces the same outputs as the web app.
+
+Images are converted in a process pool. By default there is one worker per
+core and each worker's OpenCV thread pool gets an equal share of the cores,
+so the pool uses every core without oversubscribing them. The same share
+caps the threads of the tiled edge detection on large images.
+
+Outputs go to ``OUTPUT_DIR``, mirroring the layout below each input
+directory. ``OUTPUT_DIR/batch_manifest.json`` records every input, its
+outputs, timings and errors (records of earlier runs' other inputs are
+kept). An input is skipped when the previous manifest shows it was
+converted with the same parameters and all its outputs are newer than the
+image (``--force`` converts everything again).
+
+Usage:
+    python batch.py INPUT [INPUT ...] -o OUTPUT_DIR [--params params.json]
+                    [--workers N] [--force] [--verbose]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from conversion import LOG_FORMAT, init_worker, parse_conversion_params, run_conversion, save_outputs
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+MANIFEST_NAME = 'batch_manifest.json'
+
+
+def collect_inputs(patterns):
+    """
+    Expand files, directories and glob patterns into (path, relative_dir)
+    pairs, where ``relative_dir`` is the image's folder below the directory
+    it was found in ('' for files and globs). Each image appears once.
+    """
+    found = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            for file in sorted(path.rglob('*')):
+                if file.suffix.lower() in IMAGE_EXTENSIONS and file.is_file():
+                    found.setdefault(file.resolve(), (file, str(file.parent.relative_to(path))))
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+            if not matches:
+                raise FileNotFoundError(f"No input matches '{pattern}'")
+            for match in matches:
+                file = Path(match)
+                if not file.is_file():
+                    raise FileNotFoundError(f"Input not found: {match}")
+                if file.suffix.lower() in IMAGE_EXTENSIONS:
+                    found.setdefault(file.resolve(), (file, ''))
+    return [(path.resolve(), '' if rel == '.' else rel) for path, rel in found.values()]
+
+
+def plan_outputs(inputs, output_dir):
+    """
+    Output folder and base file name of every input. Images that would
+    share a base name in one folder get a numeric suffix.
+    """
+    jobs, taken = [], set()
+    for path, rel in inputs:
+        folder = Path(output_dir) / rel
+        base, n = path.stem, 1
+        while (folder, base) in taken:
+            n += 1
+            base = f"{path.stem}_{n}"
+        taken.add((folder, base))
+        jobs.append((path, folder.resolve(), base))
+    return jobs
+
+
+def load_params(path=None):
+    """Normalized conversion parameters from a JSON file of form fields (defaults without one)."""
+    form = {}
+    if path is not None:
+        with open(path) as f:
+            form = json.load(f)
+        if not isinstance(form, dict):
+            raise ValueError(f"{path}: expected a JSON object of parameters")
+    # Form fields are strings; booleans must read 'true'/'false'
+    form = {key: str(value).lower() if isinstance(value, bool) else str(value)
+            for key, value in form.items()}
+    return parse_conversion_params(form)
+
+
+def params_digest(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_manifest(output_dir):
+    try:
+        with open(Path(output_dir) / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {entry['input']: entry for entry in manifest.get('entries', [])}
+
+
+def is_up_to_date(entry, path, digest):
+    """True if ``entry`` (from the previous manifest) converted ``path`` with the same parameters."""
+    if not entry or entry.get('status') not in ('converted', 'skipped') or entry.get('params') != digest:
+        return False
+    source_mtime = path.stat().st_mtime
+    outputs = entry.get('outputs') or []
+    return bool(outputs) and all(
+        os.path.exists(out) and os.path.getmtime(out) >= source_mtime for out in outputs)
+
+
+def convert_file(path, folder, base, params):
+    """Worker task: convert one image. Returns its manifest fields."""
+    started = time.perf_counter()
+    os.makedirs(folder, exist_ok=True)
+    # Every file is converted once, so cached stages would never be reused
+    payload, files = run_conversion(str(path), base, params, cache_stages=False)
+    entry = {
+        'outputs': [str(Path(folder) / name) for name in save_outputs(files, folder)],
+        'wall_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+    totals = payload['metrics']['totals']
+    entry.update({key: totals.get(key) for key in ('contours', 'points', 'segments', 'bytes_written')})
+    return entry
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def run_batch(patterns, output_dir, params, workers=None, force=False, log_level=logging.WARNING):
+    """
+    Convert every input image with ``params`` and write the manifest.
+
+    Returns the manifest dict.
+    """
+    started = time.perf_counter()
+    workers = workers or default_workers()
+    # Share the cores between workers' OpenCV and edge-tile thread pools
+    # (init_worker applies the share to both)
+    opencv_threads = max(1, default_workers() // workers)
+    digest = params_digest(params)
+    previous = {} if force else load_manifest(output_dir)
+
+    entries, todo = [], []
+    for path, folder, base in plan_outputs(collect_inputs(patterns), output_dir):
+        entry = {'input': str(path), 'params': digest}
+        if is_up_to_date(previous.get(str(path)), path, digest):
+            entry.update(previous[str(path)], status='skipped')
+        else:
+            todo.append((entry, path, folder, base))
+        entries.append(entry)
+    # Keep the records of inputs outside this run for later runs
+    current = {entry['input'] for entry in entries}
+    kept = [entry for path, entry in previous.items() if path not in current]
+
+    logger.info(f"{len(todo)} to convert, {len(entries) - len(todo)} up to date, "
+                f"{workers} workers x {opencv_threads} OpenCV threads")
+    if todo:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo)), initializer=init_worker,
+                                 initargs=(opencv_threads, log_level)) as pool:
+            futures = {pool.submit(convert_file, path, folder, base, params): entry
+                       for entry, path, folder, base in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                entry = futures[future]
+                try:
+                    entry.update(future.result(), status='converted')
+                    logger.info(f"[{done}/{len(todo)}] {entry['input']} ({entry['wall_ms']:.0f} ms)")
+                except Exception as e:
+                    entry.update(status='failed', error=str(e))
+                    logger.warning(f"[{done}/{len(todo)}] {entry['input']} failed: {e}")
+
+    statuses = [entry['status'] for entry in entries]
+    manifest = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': params,
+        'params_digest': digest,
+        'workers': workers,
+        'opencv_threads': opencv_threads,
+        'wall_s': round(time.perf_counter() - started, 2),
+        'converted': statuses.count('converted'),
+        'skipped': statuses.count('skipped'),
+        'failed': statuses.count('failed'),
+        'entries': entries + kept,
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(Path(output_dir) / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert folders of images to Desmos curves.")
+    parser.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns")
+    parser.add_argument('-o', '--output-dir', required=True, help="Folder for outputs and the manifest")
+    parser.add_argument('--params', help="JSON file of conversion parameters (web form field names)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: one per core)")
+    parser.add_argument('--force', action='store_true', help="Convert inputs even if up to date")
+    parser.add_argument('--verbose', action='store_true', help="Log every pipeline stage")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    try:
+        manifest = run_batch(args.inputs, args.output_dir, load_params(args.params),
+                             workers=args.workers, force=args.force,
+                             log_level=logging.INFO if args.verbose else logging.WARNING)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    logger.info(f"Converted {manifest['converted']}, skipped {manifest['skipped']}, "
+                f"failed {manifest['failed']} in {manifest['wall_s']}s; "
+                f"manifest: {Path(args.output_dir) / MANIFEST_NAME}")
+    return 1 if manifest['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
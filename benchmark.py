@@ -0,0 +1,236 @@
+"""
+Benchmark harness for the converter pipeline.
+
+Runs every pipeline stage and exporter on synthetic images of several sizes
+and kinds and on the reference images in ``images/``, and writes a JSON
+report with per-stage timings (taken from ``converter.metrics``) plus the
+environment they were measured in. Two reports can be compared to spot
+regressions between commits.
+
+Synthetic kinds:
+- noise: blurred Gaussian noise (many short, irregular contours)
+- line_art: random strokes and circles on white (clean outlines)
+- gradient: smooth shading with soft blobs and mild noise (photo-like)
+
+Usage:
+    python benchmark.py [--sizes 256,512,1024] [--kinds noise,line_art,gradient]
+                        [--repeat 3] [--no-reference] [--output report.json]
+    python benchmark.py --compare BASELINE.json CANDIDATE.json [--threshold 1.1]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+KINDS = ('noise', 'line_art', 'gradient')
+SIZES = (256, 512, 1024)
+REPORT_VERSION = 1
+
+# Exports run after fitting, in this order
+EXPORTS = ('export_to_desmos_file', 'export_for_console', 'export_desmos_graph_state',
+           'export_to_svg', 'export_to_high_res_png', 'export_contours_only', 'visualize')
+
+
+def synthetic_image(kind, size, seed=0):
+    """Generate a ``size`` x ``size`` BGR test image of the given kind."""
+    rng = np.random.default_rng(seed)
+    if kind == 'noise':
+        gray = rng.normal(128, 60, (size, size)).clip(0, 255).astype(np.uint8)
+        gray = cv2.GaussianBlur(gray, (0, 0), 2)
+    elif kind == 'line_art':
+        gray = np.full((size, size), 255, np.uint8)
+        for _ in range(max(4, size // 16)):
+            points = rng.integers(0, size, (int(rng.integers(2, 6)), 1, 2)).astype(np.int32)
+            cv2.polylines(gray, [points], False, 0, int(rng.integers(1, 4)), cv2.LINE_AA)
+        for _ in range(max(2, size // 64)):
+            center = tuple(int(v) for v in rng.integers(0, size, 2))
+            cv2.circle(gray, center, int(rng.integers(size // 32, size // 6)), 0, 2, cv2.LINE_AA)
+    elif kind == 'gradient':
+        y, x = np.mgrid[0:size, 0:size] / size
+        shade = 0.5 + 0.25 * np.sin(3 * x + 2 * y) + 0.15 * np.cos(5 * y - x)
+        for _ in range(6):
+            cx, cy, r = rng.random(3) * [1, 1, 0.25] + [0, 0, 0.05]
+            shade += rng.choice([-0.3, 0.3]) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / r ** 2)
+        shade += rng.normal(0, 0.02, shade.shape)
+        gray = (shade.clip(0, 1) * 255).astype(np.uint8)
+    else:
+        raise ValueError(f"Unknown synthetic kind '{kind}'")
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def run_case(image_path, output_dir):
+    """Run the full pipeline once on ``image_path``; returns the converter's metric records."""
+    from base import ImageToDesmosConverter
+
+    converter = ImageToDesmosConverter(str(image_path), stage_cache=None)
+    converter.output_dir = Path(output_dir)
+    converter.load_and_preprocess()
+    converter.detect_edges()
+    converter.simplify_contours()
+    converter.fit_curves_parametric()
+    for export in EXPORTS:
+        getattr(converter, export)()
+    # Morphology replaces the contours, so it is timed last on the same edge map
+    converter.clean_edges()
+    return converter.metrics.stages
+
+
+def summarize(runs):
+    """Per-stage median/min wall time, median CPU time and the counts of the first run."""
+    stages = {}
+    for records in runs:
+        for record in records:
+            stages.setdefault(record['stage'], []).append(record)
+    summary = {}
+    for name, records in stages.items():
+        walls = [r['wall_ms'] for r in records]
+        first = records[0]
+        summary[name] = {
+            'wall_ms': round(statistics.median(walls), 2),
+            'min_wall_ms': round(min(walls), 2),
+            'cpu_ms': round(statistics.median(r['cpu_ms'] for r in records), 2),
+            'rss_growth_kb': first['rss_growth_kb'],
+            'contours': first['contours'],
+            'points': first['points'],
+            'segments': first['segments'],
+            'bytes_written': first['bytes_written'],
+        }
+    return summary
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+
+def run_benchmark(sizes=SIZES, kinds=KINDS, reference=True, repeat=3, seed=0):
+    """
+    Benchmark synthetic images (every kind at every size) and, with
+    ``reference``, the images in ``images/``. Returns the report dict.
+    """
+    cases = []
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        inputs = []
+        for kind in kinds:
+            for size in sizes:
+                path = workdir / f"{kind}_{size}.png"
+                cv2.imwrite(str(path), synthetic_image(kind, size, seed))
+                inputs.append((f"{kind}_{size}", kind, path))
+        if reference:
+            for path in sorted((Path(__file__).parent / 'images').glob('*.png')):
+                inputs.append((path.stem, 'reference', path))
+
+        for name, kind, path in inputs:
+            height, width = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE).shape
+            started = time.perf_counter()
+            runs = [run_case(path, workdir / 'outputs') for _ in range(repeat)]
+            stages = summarize(runs)
+            cases.append({
+                'name': name,
+                'kind': kind,
+                'width': width,
+                'height': height,
+                'stages': stages,
+                'total_ms': round(sum(s['wall_ms'] for s in stages.values()), 2),
+            })
+            print(f"{name:24}{width:>6}×{height:<6}{cases[-1]['total_ms']:>12.1f} ms"
+                  f"  ({time.perf_counter() - started:.1f}s for {repeat} runs)")
+
+    return {
+        'version': REPORT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'seed': seed,
+        'environment': environment(),
+        'cases': cases,
+    }
+
+
+def compare_reports(baseline, candidate, threshold=1.1):
+    """
+    Stage-by-stage wall-time ratios (candidate / baseline) for cases and
+    stages present in both reports. Returns a list of
+    (case, stage, baseline_ms, candidate_ms, ratio, regressed) tuples.
+    """
+    before = {case['name']: case for case in baseline['cases']}
+    rows = []
+    for case in candidate['cases']:
+        if case['name'] not in before:
+            continue
+        old_stages = before[case['name']]['stages']
+        for stage, stats in case['stages'].items():
+            if stage not in old_stages:
+                continue
+            old, new = old_stages[stage]['wall_ms'], stats['wall_ms']
+            ratio = new / old if old > 0 else float('inf')
+            rows.append((case['name'], stage, old, new, ratio, ratio > threshold))
+    return rows
+
+
+def print_comparison(rows, threshold):
+    print(f"{'case':24}{'stage':20}{'before ms':>12}{'after ms':>12}{'ratio':>8}")
+    for case, stage, old, new, ratio, regressed in rows:
+        flag = '  <-- slower' if regressed else ''
+        print(f"{case:24}{stage:20}{old:>12.1f}{new:>12.1f}{ratio:>8.2f}{flag}")
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} of {len(rows)} stage timings slower than {threshold:.2f}x baseline")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image-to-Desmos pipeline.")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help="Comma-separated synthetic image sizes (default: %(default)s)")
+    parser.add_argument('--kinds', default=','.join(KINDS),
+                        help="Comma-separated synthetic kinds (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per image (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="Synthetic image seed")
+    parser.add_argument('--no-reference', action='store_true', help="Skip the images/ set")
+    parser.add_argument('--output', default='benchmark.json', help="Report path (default: %(default)s)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help="Compare two reports instead of running")
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help="Ratio above which a stage counts as slower (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, candidate = (json.loads(Path(p).read_text()) for p in args.compare)
+        regressions = print_comparison(compare_reports(baseline, candidate, args.threshold), args.threshold)
+        return 1 if regressions else 0
+
+    # Keep the pipeline's per-stage messages out of the benchmark output
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmark(sizes=[int(s) for s in args.sizes.split(',') if s],
+                           kinds=[k for k in args.kinds.split(',') if k],
+                           reference=not args.no_reference, repeat=args.repeat, seed=args.seed)
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Expression budget: fit a conversion into a target number of Desmos expressions.
+
+Every contour gets a significance score (length, enclosed area, edge
+contrast) and a cost curve: the number of segments it produces at each level
+of a geometric ladder of simplification tolerances. Both are computed once.
+Finding the plan is then only array work: for each coarsening level the most
+significant contours are kept while the cumulative cost fits the budget, and
+the level keeping the most significance wins, discounted per level so that
+coarsening has to pay for the detail it smears.
+
+Adaptive fits can only be counted by fitting, so their cost curves are
+estimated (``scale_costs``); a level is counted exactly once a plan
+chooses it, until the chosen level's costs are exact.
+"""
+import cv2
+import numpy as np
+
+
+# Simplification ladder: level k uses epsilon_factor * GROWTH**k (level 0 keeps contours as is)
+LEVELS = 8
+GROWTH = 2.0
+
+# Kept significance is weighted by LEVEL_DISCOUNT**level when comparing levels
+LEVEL_DISCOUNT = 0.85
+
+
+def contour_significance(contours, gray, closed=True):
+    """
+    Score contours by (arc length + sqrt(area)) times mean edge contrast.
+
+    Contrast is the mean Sobel gradient magnitude of ``gray`` at the contour
+    points, so faint texture ranks below strong outlines of the same size.
+    """
+    if not contours:
+        return np.zeros(0)
+    gradient = cv2.magnitude(cv2.Sobel(gray, cv2.CV_32F, 1, 0), cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+    height, width = gray.shape[:2]
+    scores = np.empty(len(contours))
+    for i, contour in enumerate(contours):
+        points = contour.reshape(-1, 2)
+        xs = np.clip(points[:, 0], 0, width - 1)
+        ys = np.clip(points[:, 1], 0, height - 1)
+        size = cv2.arcLength(contour, closed) + np.sqrt(abs(cv2.contourArea(contour)))
+        scores[i] = size * gradient[ys, xs].mean()
+    return scores
+
+
+def simplification_ladder(contours, epsilon_factor, levels=LEVELS, growth=GROWTH, closed=True):
+    """
+    Simplify every contour at each level of the tolerance ladder.
+    ``closed`` is False for open polylines (stitched contours).
+
+    Returns a list of ``levels`` contour lists; level 0 is ``contours`` itself.
+    """
+    perimeters = [cv2.arcLength(c, closed) for c in contours]
+    ladder = [list(contours)]
+    for level in range(1, levels):
+        factor = epsilon_factor * growth ** level
+        ladder.append([cv2.approxPolyDP(c, factor * p, closed) for c, p in zip(contours, perimeters)])
+    return ladder
+
+
+def scale_costs(fixed_costs, exact_first, exact_last):
+    """
+    Estimate cost curves of an expensive-to-count fit from cheap ones.
+
+    ``fixed_costs`` (levels, n_contours) are fixed-window segment counts;
+    ``exact_first`` and ``exact_last`` are the fit's real per-contour counts
+    at the first and last level. In between, each contour's count follows
+    its fixed-window count as a power law through both exact ends.
+    """
+    fixed = np.maximum(np.asarray(fixed_costs, dtype=np.float64), 1)
+    first = np.maximum(np.asarray(exact_first, dtype=np.float64), 1)
+    last = np.maximum(np.asarray(exact_last, dtype=np.float64), 1)
+    shrink = np.log(fixed[0] / fixed[-1])
+    exponent = np.divide(np.log(first / last), shrink, out=np.zeros_like(shrink), where=shrink > 0)
+    estimate = np.ceil(first * (fixed / fixed[0]) ** exponent - 1e-9).astype(np.int64)
+    estimate[0], estimate[-1] = exact_first, exact_last
+    return estimate
+
+
+def plan_budget(costs, scores, budget, level_discount=LEVEL_DISCOUNT):
+    """
+    Choose a coarsening level and the contours to keep.
+
+    Parameters:
+    - costs: (levels, n_contours) segments per contour at each level,
+             non-increasing along the level axis
+    - scores: (n_contours,) significance scores
+    - budget: Maximum total segments
+
+    Returns (level, keep) where ``keep`` is a boolean mask over contours.
+    """
+    costs = np.asarray(costs)
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    cumulative_score = np.concatenate(([0.0], np.cumsum(np.asarray(scores)[order])))
+
+    # For each level: the longest prefix of the ranking that fits the budget
+    prefix_cost = np.cumsum(costs[:, order], axis=1)
+    kept = np.array([np.searchsorted(row, budget, side='right') for row in prefix_cost])
+    kept_score = cumulative_score[kept]
+
+    level = int(np.argmax(kept_score * level_discount ** np.arange(len(kept_score))))
+    keep = np.zeros(costs.shape[1], dtype=bool)
+    keep[order[:kept[level]]] = True
+    return level, keep
@@ -0,0 +1,196 @@
+"""
+Content-addressed cache of conversion results for the web app.
+
+Entries are keyed by a hash of the uploaded image bytes plus the normalized
+conversion parameters. Each entry owns the output files it generated under
+the output folder and the JSON payload returned to the client, so a repeated
+request can be answered without running the pipeline again. Entries can also
+own lazy files, rendered after the entry was stored (see ``add_file``).
+
+Every entry is also recorded in ``<key>.cache.json`` next to its files, so
+a restarted process reloads the index and keeps evicting (and counting
+against ``max_bytes``) the outputs of earlier runs.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Suffix of the per-entry index records in the cache directory
+RECORD_SUFFIX = '.cache.json'
+
+
+def cache_key(image_bytes, params):
+    """Stable hex digest of the image bytes and the (normalized) parameter dict."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(json.dumps(params, sort_keys=True, separators=(',', ':')).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache of conversion results with size and age limits.
+
+    Parameters:
+    - directory: Folder holding the cached output files
+    - max_bytes: Total size of cached files before least-recently-used
+                 entries are evicted
+    - max_age: Seconds after which an entry expires
+    - max_entries: Maximum number of entries kept
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, max_age=24 * 3600, max_entries=500):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Lazy file name -> key of the entry owning it
+        self._owners = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._load()
+
+    def get(self, key):
+        """Cached payload for ``key``, or None on a miss (expired or missing files count as misses)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self._expired(entry) or not self._files_exist(entry)):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry['last_access'] = time.time()
+            self.hits += 1
+            return entry['payload']
+
+    def put(self, key, payload, files, lazy_files=()):
+        """
+        Store ``payload`` for ``key``; ``files`` are output file names (relative
+        to ``directory``) owned by the entry and deleted on eviction.
+        ``lazy_files`` may not exist yet: they are deleted with the entry if
+        they do, but a missing one does not invalidate it.
+        """
+        size = sum(os.path.getsize(os.path.join(self.directory, f))
+                   for f in files if os.path.exists(os.path.join(self.directory, f)))
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._drop(key, delete_files=False)
+            self._entries[key] = {
+                'payload': payload,
+                'files': list(files),
+                'lazy_files': list(lazy_files),
+                'size': size,
+                'created': now,
+                'last_access': now,
+            }
+            self._owners.update((name, key) for name in lazy_files)
+            self._bytes += size
+            self._save(key)
+            self._evict()
+
+    def owner(self, filename):
+        """Key of the live entry owning lazy file ``filename``, or None."""
+        with self._lock:
+            key = self._owners.get(filename)
+            return key if key in self._entries else None
+
+    def add_file(self, filename, size):
+        """
+        Account for lazy file ``filename`` (``size`` bytes) having been written.
+        Returns False if no live entry owns it; the caller should delete it.
+        """
+        with self._lock:
+            entry = self._entries.get(self._owners.get(filename))
+            if entry is None:
+                return False
+            entry['size'] += size
+            self._bytes += size
+            self._save(self._owners[filename])
+            self._evict()
+            return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+            }
+
+    def _record_path(self, key):
+        return Path(self.directory, key + RECORD_SUFFIX)
+
+    def _save(self, key):
+        # Written under a temporary name so a crash never leaves a partial record
+        path = self._record_path(key)
+        partial = path.with_name(path.name + '.partial')
+        partial.write_text(json.dumps(self._entries[key]))
+        os.replace(partial, path)
+
+    def _load(self):
+        """Rebuild the index from the records of earlier processes."""
+        records = []
+        for path in Path(self.directory).glob('*' + RECORD_SUFFIX):
+            try:
+                records.append((path.name[:-len(RECORD_SUFFIX)], json.loads(path.read_text())))
+            except (OSError, ValueError):
+                path.unlink(missing_ok=True)
+        for key, entry in sorted(records, key=lambda record: record[1].get('last_access', 0)):
+            try:
+                names = entry['files'] + entry['lazy_files']
+                # Lazy files rendered after the record was last written count too
+                entry['size'] = sum(os.path.getsize(os.path.join(self.directory, f)) for f in names
+                                    if os.path.exists(os.path.join(self.directory, f)))
+            except (KeyError, TypeError):
+                self._record_path(key).unlink(missing_ok=True)
+                continue
+            self._entries[key] = entry
+            self._owners.update((name, key) for name in entry['lazy_files'])
+            self._bytes += entry['size']
+            if self._expired(entry) or not self._files_exist(entry):
+                self._drop(key)
+        self._evict()
+
+    def _expired(self, entry):
+        return self.max_age is not None and time.time() - entry['created'] > self.max_age
+
+    def _files_exist(self, entry):
+        return all(os.path.exists(os.path.join(self.directory, f)) for f in entry['files'])
+
+    def _evict(self):
+        for key in [k for k, e in self._entries.items() if self._expired(e)]:
+            self._drop(key)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key, delete_files=True):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+        for f in entry['lazy_files']:
+            if self._owners.get(f) == key:
+                del self._owners[f]
+        self._record_path(key).unlink(missing_ok=True)
+        if delete_files:
+            self.evictions += 1
+            for f in entry['files'] + entry['lazy_files']:
+                try:
+                    os.remove(os.path.join(self.directory, f))
+                except OSError:
+                    pass
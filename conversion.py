@@ -0,0 +1,328 @@
+"""
+Conversion entry points shared by the web app and its worker processes.
+"""
+import logging
+import os
+from pathlib import Path
+
+import cv2
+
+from base import ImageToDesmosConverter
+from curves import CurveSet
+from exporters import iter_console_commands, iter_console_list_commands, iter_desmos_text
+from formatting import CurveFormatter
+from jobs import report_progress
+from render import rasterize
+from stages import StageCache, default_stage_cache
+from tiling import TILE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Pipeline messages are plain progress lines
+LOG_FORMAT = '%(message)s'
+
+# Edge detection runs on tiles of this size for larger uploads (0 disables);
+# the edge map is the same either way, so it is not part of the parameters
+EDGE_TILE_SIZE = int(os.environ.get('EDGE_TILE_SIZE', TILE_SIZE))
+
+# Tile threads per conversion; set by init_worker in pool processes
+# (None outside a pool: one per core)
+_tile_workers = None
+
+# Stage cache of conversions in this process; init_worker can resize or disable it
+_stage_cache = default_stage_cache
+
+
+def init_worker(opencv_threads=1, log_level=logging.INFO, stage_cache_bytes=None):
+    """
+    Process-pool initializer: limit OpenCV and edge-tile threads so workers
+    don't oversubscribe cores, and log pipeline messages like the parent process.
+    ``stage_cache_bytes`` bounds this worker's stage cache (0 disables it;
+    default: the StageCache default).
+    """
+    global _tile_workers, _stage_cache
+    cv2.setNumThreads(opencv_threads)
+    _tile_workers = opencv_threads
+    if stage_cache_bytes is not None:
+        _stage_cache = StageCache(max_bytes=stage_cache_bytes) if stage_cache_bytes > 0 else None
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    # Forked workers inherit the parent's configured root logger
+    logging.getLogger().setLevel(log_level)
+
+
+def parse_conversion_params(form):
+    """
+    Parse and normalize conversion parameters from the submitted form.
+    
+    Options that have no effect (e.g. bilateral settings while the bilateral
+    filter is off, or fitting settings in contours-only mode) are dropped so
+    equivalent requests share one cache key.
+    """
+    params = {
+        'manual_rotation': float(form.get('rotation', 0)),
+        'low_threshold': int(form.get('low_threshold', 30)),
+        'high_threshold': int(form.get('high_threshold', 100)),
+        'epsilon_factor': float(form.get('epsilon_factor', 0.0001)),
+        'min_contour_area': int(form.get('min_contour_area', 20)),
+        'contours_only': form.get('contours_only', 'false').lower() == 'true',
+        'use_bilateral': form.get('use_bilateral', 'false').lower() == 'true',
+        'use_posterize': form.get('use_posterize', 'false').lower() == 'true',
+        'use_morphology': form.get('use_morphology', 'false').lower() == 'true',
+        'use_stitching': form.get('use_stitching', 'false').lower() == 'true',
+    }
+    
+    if not params['contours_only']:
+        params['segment_size'] = int(form.get('segment_size', 5))
+        # Expression budget (unlimited otherwise)
+        max_expressions = int(form.get('max_expressions', 0))
+        if max_expressions > 0:
+            params['max_expressions'] = max_expressions
+        # Adaptive segmentation tolerance in pixels (fixed windows otherwise)
+        fit_tolerance = float(form.get('fit_tolerance', 0))
+        if fit_tolerance > 0:
+            params['fit_tolerance'] = fit_tolerance
+        # Least-squares fit degree (interpolation otherwise)
+        fit_degree = int(form.get('fit_degree', 0))
+        if fit_degree > 0:
+            params['fit_degree'] = fit_degree
+        # Console script with segments packed into coefficient lists
+        if form.get('list_encoding', 'false').lower() == 'true':
+            params['list_encoding'] = True
+    
+    # Line extraction: Canny edge contours or stroke centerlines
+    params['edge_mode'] = form.get('edge_mode', 'canny')
+    if params['edge_mode'] not in ('canny', 'skeleton'):
+        raise ValueError(f"Unknown edge mode: {params['edge_mode']}")
+    if params['edge_mode'] == 'skeleton':
+        for key in ('low_threshold', 'high_threshold', 'min_contour_area'):
+            del params[key]
+        # Morphology would re-trace the skeleton as closed contours
+        params['use_morphology'] = False
+        # Stroke threshold gray level (Otsu's threshold otherwise)
+        skeleton_threshold = int(form.get('skeleton_threshold', 0))
+        if skeleton_threshold > 0:
+            params['skeleton_threshold'] = skeleton_threshold
+    
+    # Working resolution limit (full resolution otherwise)
+    megapixels = float(form.get('max_working_megapixels', 0))
+    if megapixels > 0:
+        params['max_working_pixels'] = int(megapixels * 1_000_000)
+    
+    # Bilateral filter parameters (Gaussian blur otherwise)
+    if params['use_bilateral']:
+        params['bilateral_d'] = int(form.get('bilateral_d', 9))
+        params['bilateral_sigma_color'] = int(form.get('bilateral_sigma_color', 75))
+        params['bilateral_sigma_space'] = int(form.get('bilateral_sigma_space', 75))
+    else:
+        params['blur_size'] = int(form.get('blur_size', 3))
+    
+    # Posterization parameters
+    if params['use_posterize']:
+        params['posterize_levels'] = int(form.get('posterize_levels', 4))
+    
+    # Morphology parameters
+    if params['use_morphology']:
+        params['morph_close'] = int(form.get('morph_close', 3))
+        params['morph_open'] = int(form.get('morph_open', 2))
+    
+    return params
+
+
+# DPI of the output PNG shown in the web app
+OUTPUT_PNG_DPI = 150
+
+
+def _render_desmos(curves, width, height):
+    return ''.join(iter_desmos_text(CurveFormatter(curves))).encode()
+
+
+def _render_console(curves, width, height):
+    return ''.join(iter_console_commands(CurveFormatter(curves))).encode()
+
+
+def _render_console_lists(curves, width, height):
+    return ''.join(iter_console_list_commands(CurveFormatter(curves))).encode()
+
+
+def _render_png(curves, width, height):
+    # As ImageToDesmosConverter.export_to_high_res_png with the opencv backend
+    canvas = rasterize(curves, width, height, scale=OUTPUT_PNG_DPI / 100,
+                       thickness=0.5 * OUTPUT_PNG_DPI / 72)
+    return cv2.imencode('.png', canvas)[1].tobytes()
+
+
+# Exports rendered on demand from a stored ``<base>_curves.npz``: suffix -> renderer
+LAZY_EXPORTS = {
+    '_desmos.txt': _render_desmos,
+    '_console.txt': _render_console,
+    '_output.png': _render_png,
+    '_console_lists.txt': _render_console_lists,
+}
+CURVES_SUFFIX = '_curves.npz'
+
+
+def lazy_export_names(base_filename):
+    """File names of the exports ``render_export`` can produce for a conversion."""
+    return [base_filename + suffix for suffix in LAZY_EXPORTS]
+
+
+def render_export(output_folder, filename):
+    """
+    Render a lazy export (e.g. ``<base>_console.txt``) from the conversion's
+    stored curves into ``output_folder``.
+
+    Returns the number of bytes written, or None if ``filename`` is not a
+    lazy export or its curves file does not exist.
+    """
+    for suffix, renderer in LAZY_EXPORTS.items():
+        if filename.endswith(suffix):
+            break
+    else:
+        return None
+    curves_path = Path(output_folder, filename[:-len(suffix)] + CURVES_SUFFIX)
+    if not curves_path.exists():
+        return None
+    curves, metadata = CurveSet.load(curves_path)
+    width, height = (int(v) for v in metadata['size'])
+    data = renderer(curves, width, height)
+    # Written under a temporary name so a concurrent reader never sees a partial file
+    target = Path(output_folder, filename)
+    partial = target.with_name(target.name + '.partial')
+    partial.write_bytes(data)
+    os.replace(partial, target)
+    return len(data)
+
+
+def run_conversion(image, base_filename, params, progress=None, lazy=False, cache_stages=True):
+    """
+    Run the converter on an uploaded image, entirely in memory.
+    
+    Runs in a job-queue worker process, so it must not depend on Flask.
+    ``image`` is a file path, the uploaded file's bytes or a decoded array.
+    ``progress`` receives the converter's per-stage events; it may raise to
+    abort the conversion (e.g. before the PNG export of a cancelled job).
+    
+    With ``lazy`` a full conversion stops after fitting and only stores the
+    curves (``<base>_curves.npz``); the desmos, console and PNG exports are
+    rendered from them on first download (``render_export``), and the payload
+    has no ``console_input``. ``cache_stages=False`` skips the process's stage
+    cache, for images converted only once.
+    
+    Returns (payload, files): the JSON response body and the exports as a
+    dict of file name -> bytes (see ``save_outputs``). ``payload['metrics']``
+    holds the converter's per-stage timings and counts (see instrumentation.py).
+    """
+    converter = ImageToDesmosConverter(image, stage_cache=_stage_cache if cache_stages else None,
+                                       progress_callback=progress, persist=False,
+                                       name=base_filename)
+    converter.load_and_preprocess(manual_rotation=params['manual_rotation'],
+                                  max_working_pixels=params.get('max_working_pixels'))
+    
+    # Apply posterization if requested
+    if params['use_posterize']:
+        converter.posterize(levels=params['posterize_levels'])
+    
+    if params.get('edge_mode') == 'skeleton':
+        # Stroke centerlines for line art
+        converter.detect_skeleton(threshold=params.get('skeleton_threshold'),
+                                  blur_size=params.get('blur_size', 3))
+    else:
+        converter.detect_edges(
+            low_threshold=params['low_threshold'], 
+            high_threshold=params['high_threshold'],
+            blur_size=params.get('blur_size', 3), 
+            min_contour_area=params['min_contour_area'],
+            use_bilateral=params['use_bilateral'],
+            bilateral_d=params.get('bilateral_d', 9),
+            bilateral_sigma_color=params.get('bilateral_sigma_color', 75),
+            bilateral_sigma_space=params.get('bilateral_sigma_space', 75),
+            tile_size=EDGE_TILE_SIZE or None,
+            tile_workers=_tile_workers
+        )
+    
+    # Apply morphological cleanup if requested
+    if params['use_morphology']:
+        converter.clean_edges(close_kernel=params['morph_close'], open_kernel=params['morph_open'],
+                              min_contour_area=params['min_contour_area'])
+    
+    # Merge double-traced and touching contours into single strokes if requested
+    if params.get('use_stitching'):
+        converter.stitch_contours()
+    
+    converter.simplify_contours(epsilon_factor=params['epsilon_factor'])
+    
+    # Generate output files - just pass filenames, base.py handles the output_dir
+    if params['contours_only']:
+        # Only export contours visualization
+        contours_file = f"{base_filename}_contours_only.png"
+        converter.export_contours_only(contours_file, show_original=True)
+        logger.info("Stage metrics:\n" + converter.metrics.format_table())
+        
+        # Get stats
+        total_contours = len(converter.contours)
+        total_points = sum(len(c) for c in converter.contours)
+        
+        return {
+            'success': True,
+            'contours_only': True,
+            'output_image': f'/download/{contours_file}',
+            'total_contours': total_contours,
+            'total_points': total_points,
+            'metrics': converter.metrics.to_dict(),
+            'message': f'Preview complete: {total_contours} contours detected with {total_points} points'
+        }, converter.outputs
+    
+    # Full Desmos processing
+    if params.get('max_expressions'):
+        converter.limit_expressions(params['max_expressions'], segment_size=params['segment_size'],
+                                    epsilon_factor=params['epsilon_factor'],
+                                    tolerance=params.get('fit_tolerance'),
+                                    degree=params.get('fit_degree'))
+    converter.fit_curves_parametric(segment_size=params['segment_size'],
+                                    tolerance=params.get('fit_tolerance'),
+                                    degree=params.get('fit_degree'))
+    
+    desmos_file, console_file, output_png, console_lists_file = lazy_export_names(base_filename)
+    if params.get('list_encoding'):
+        console_file = console_lists_file
+    
+    if lazy:
+        converter.export_curves(base_filename + CURVES_SUFFIX)
+    else:
+        converter.export_to_desmos_file(desmos_file)
+        converter.export_for_console(console_file, lists=params.get('list_encoding', False))
+        converter.export_to_high_res_png(output_png, dpi=OUTPUT_PNG_DPI)
+    
+    logger.info("Stage metrics:\n" + converter.metrics.format_table())
+    
+    # Get stats
+    total_curves = len(converter.curves)
+    
+    payload = {
+        'success': True,
+        'contours_only': False,
+        'output_image': f'/download/{output_png}',
+        'desmos_file': f'/download/{desmos_file}',
+        'console_file': f'/download/{console_file}',
+        'total_curves': total_curves,
+        'metrics': converter.metrics.to_dict(),
+        'message': f'Successfully converted image with {total_curves} polynomial curves!'
+    }
+    if not lazy:
+        payload['console_input'] = converter.outputs[console_file].decode()
+    return payload, converter.outputs
+
+
+def save_outputs(files, output_folder):
+    """Write the ``{name: bytes}`` exports of run_conversion to ``output_folder``; returns the names."""
+    for name, data in files.items():
+        Path(output_folder, name).write_bytes(data)
+    return list(files)
+
+
+def convert_upload(image_bytes, base_filename, params):
+    """
+    Job-queue task: run_conversion on the uploaded bytes with progress
+    reporting, leaving the exports to be rendered on download.
+    """
+    return run_conversion(image_bytes, base_filename, params, progress=report_progress, lazy=True)
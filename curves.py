@@ -0,0 +1,117 @@
+"""
+Compact array-backed storage for fitted parametric polynomial segments.
+"""
+import numpy as np
+
+
+class CurveSet:
+    """
+    Parametric polynomial segments stored as contiguous arrays.
+
+    Attributes:
+    - coeffs_x, coeffs_y: float64 arrays of shape (n_segments, degree + 1),
+      highest power first (``np.poly1d`` order). Lower-degree segments are
+      left-padded with zeros.
+    - contour_index: Source contour of each segment, shape (n_segments,)
+    - t_range: Position of each segment along its contour, shape (n_segments, 2)
+    - curve_offsets: Segment offsets of each curve (a contour with at least one
+      segment), shape (n_curves + 1,). Curve ``i`` owns segments
+      ``curve_offsets[i]:curve_offsets[i + 1]``.
+    """
+
+    def __init__(self, coeffs_x, coeffs_y, contour_index=None, t_range=None):
+        self.coeffs_x = np.ascontiguousarray(coeffs_x, dtype=np.float64)
+        self.coeffs_y = np.ascontiguousarray(coeffs_y, dtype=np.float64)
+        if self.coeffs_x.shape != self.coeffs_y.shape or self.coeffs_x.ndim != 2:
+            raise ValueError("coeffs_x and coeffs_y must share a (n_segments, degree+1) shape")
+
+        n = len(self.coeffs_x)
+        if contour_index is None:
+            contour_index = np.arange(n)
+        if t_range is None:
+            t_range = np.tile([0.0, 1.0], (n, 1))
+        self.contour_index = np.ascontiguousarray(contour_index, dtype=np.int64)
+        self.t_range = np.ascontiguousarray(t_range, dtype=np.float64).reshape(n, 2)
+
+        bounds = np.flatnonzero(np.diff(self.contour_index)) + 1
+        self.curve_offsets = np.concatenate(([0], bounds, [n])).astype(np.int64) if n else np.zeros(1, dtype=np.int64)
+
+    @classmethod
+    def empty(cls, degree=0):
+        return cls(np.empty((0, degree + 1)), np.empty((0, degree + 1)))
+
+    def __len__(self):
+        return len(self.coeffs_x)
+
+    @property
+    def degree(self):
+        return self.coeffs_x.shape[1] - 1
+
+    @property
+    def n_curves(self):
+        return len(self.curve_offsets) - 1
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.coeffs_x, self.coeffs_y, self.contour_index,
+                                      self.t_range, self.curve_offsets))
+
+    def subset(self, start, stop):
+        """CurveSet holding segments ``start:stop`` (array views, no copies)."""
+        return CurveSet(self.coeffs_x[start:stop], self.coeffs_y[start:stop],
+                        self.contour_index[start:stop], self.t_range[start:stop])
+
+    def curve_slice(self, curve):
+        """Segment slice belonging to curve number ``curve``."""
+        return slice(self.curve_offsets[curve], self.curve_offsets[curve + 1])
+
+    def affine(self, scale_x, shift_x, scale_y, shift_y):
+        """CurveSet mapped through x -> scale_x*x + shift_x, y -> scale_y*y + shift_y."""
+        coeffs_x = self.coeffs_x * scale_x
+        coeffs_y = self.coeffs_y * scale_y
+        coeffs_x[:, -1] += shift_x
+        coeffs_y[:, -1] += shift_y
+        return CurveSet(coeffs_x, coeffs_y, self.contour_index, self.t_range)
+
+    def evaluate(self, t):
+        """
+        Evaluate every segment at parameter values ``t`` with one Horner pass.
+
+        Returns (x, y), each of shape (n_segments, len(t)).
+        """
+        t = np.asarray(t, dtype=np.float64)
+        x = np.zeros((len(self), len(t)))
+        y = np.zeros((len(self), len(t)))
+        for j in range(self.degree + 1):
+            x *= t
+            x += self.coeffs_x[:, j, None]
+            y *= t
+            y += self.coeffs_y[:, j, None]
+        return x, y
+
+    def save(self, file, **metadata):
+        """Write the segment arrays, plus any ``metadata`` arrays, with ``np.savez``."""
+        np.savez(file, coeffs_x=self.coeffs_x, coeffs_y=self.coeffs_y,
+                 contour_index=self.contour_index, t_range=self.t_range, **metadata)
+
+    @classmethod
+    def load(cls, file):
+        """Read a CurveSet written by ``save``. Returns (curves, metadata dict)."""
+        with np.load(file) as data:
+            arrays = {name: data[name] for name in data.files}
+        curves = cls(arrays.pop('coeffs_x'), arrays.pop('coeffs_y'),
+                     arrays.pop('contour_index'), arrays.pop('t_range'))
+        return curves, arrays
+
+    def to_equations(self):
+        """Legacy view: list of ``{'segments': [{'t_range', 'poly_x', 'poly_y'}]}`` dicts."""
+        equations = []
+        for curve in range(self.n_curves):
+            equations.append({
+                'segments': [{
+                    't_range': (self.t_range[i, 0], self.t_range[i, 1]),
+                    'poly_x': np.poly1d(self.coeffs_x[i]),
+                    'poly_y': np.poly1d(self.coeffs_y[i])
+                } for i in range(*self.curve_slice(curve).indices(len(self)))]
+            })
+        return equations
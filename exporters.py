@@ -0,0 +1,386 @@
+"""
+Streaming exporters for Desmos text/JSON and SVG output.
+
+Each exporter is a generator that yields the output text in small chunks,
+rendering the curves block by block. Chunks can be written to a buffered
+file with ``write_stream`` or handed directly to a streaming HTTP response,
+so peak memory does not grow with the number of curves.
+"""
+import json
+
+import numpy as np
+
+from formatting import effective_degrees, render_list
+
+
+# Segments rendered per block by the streaming exporters
+CHUNK_SIZE = 4096
+
+# Points sampled per segment for SVG polylines
+SVG_SAMPLES = 50
+
+# Largest deviation (pixels) of the cubic Beziers standing in for a higher-degree
+# segment, and the most cubics one segment is split into
+BEZIER_TOLERANCE = 0.1
+BEZIER_MAX_PIECES = 8
+
+# Segment endpoints closer than this (in pixels) are joined without a moveto
+_JOIN_TOLERANCE = 1e-3
+
+# Placeholder spliced out of the graph-state JSON skeleton
+_EXPRESSIONS_SENTINEL = "__EXPRESSIONS__"
+
+# Longest list Desmos accepts
+LIST_LIMIT = 10000
+
+
+def write_stream(chunks, filename, buffer_size=1 << 16):
+    """Write an iterable of text chunks to ``filename``. Returns characters written."""
+    written = 0
+    with open(filename, 'w', buffering=buffer_size) as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def iter_desmos_text(formatter, chunk_size=CHUNK_SIZE):
+    """Yield the plain-text x(t)/y(t) listing, one curve per chunk."""
+    yield ("=" * 80 + "\n"
+           "DESMOS OUTPUT - Parametric Polynomial Equations\n"
+           + "=" * 80 + "\n\n"
+           "INSTRUCTIONS:\n"
+           "1. Copy each pair of x(t) and y(t) equations below\n"
+           "2. In Desmos, paste them into expression boxes\n"
+           "3. Desmos will create parametric curves automatically\n\n"
+           + "=" * 80 + "\n\n")
+
+    curve_num = 1
+    for x_exprs, y_exprs in formatter.iter_render('text', chunk_size):
+        for x_equation, y_equation in zip(x_exprs, y_exprs):
+            yield (f"\n{'='*80}\n"
+                   f"CURVE {curve_num}\n"
+                   f"{'='*80}\n\n"
+                   f"x(t) = {x_equation}\n\n"
+                   f"y(t) = {y_equation}\n\n"
+                   "Domain: {0 ≤ t ≤ 1}\n\n")
+            curve_num += 1
+
+
+def iter_console_commands(formatter, chunk_size=CHUNK_SIZE):
+    """Yield ``Calc.setBlank()`` followed by one ``Calc.setExpression`` per segment."""
+    yield "Calc.setBlank();\n"
+
+    curve_id = 1
+    for x_exprs, y_exprs in formatter.iter_render('latex', chunk_size):
+        for x_latex, y_latex in zip(x_exprs, y_exprs):
+            # Backslashes are doubled for the JavaScript string literal
+            yield ("Calc.setExpression({\n"
+                   f"                  id: 'curve-{curve_id}',\n"
+                   "                  type: 'expression',\n"
+                   f"                  latex: '\\\\left({x_latex},{y_latex}\\\\right)',\n"
+                   "                  color: '#000000',\n"
+                   "                  lineWidth: '1',\n"
+                   "                  lineOpacity: '1',\n"
+                   "                  parametricDomain: { min: '0', max: '1' }\n"
+                   "                });\n")
+            curve_id += 1
+
+
+def list_groups(curves, limit=LIST_LIMIT):
+    """
+    List-based encoding of ``curves``: segments grouped by effective degree,
+    at most ``limit`` per group.
+
+    Yields one (definitions, curve) pair per group, numbered g = 1, 2, ...:
+    ``definitions`` are (name, latex) pairs ``A_{gpk}=[...]`` and
+    ``B_{gpk}=[...]`` holding the t^k coefficients of x and y of every
+    segment in the group; ``curve`` is the single parametric expression
+    that Desmos broadcasts over the lists, drawing one curve per segment.
+    """
+    degrees = effective_degrees(curves.coeffs_x, curves.coeffs_y)
+    n_cols = curves.degree + 1
+    group = 0
+    for degree in np.unique(degrees)[::-1]:
+        members = np.flatnonzero(degrees == degree)
+        for start in range(0, len(members), limit):
+            rows = members[start:start + limit]
+            group += 1
+            definitions = []
+            terms = {'A': [], 'B': []}
+            for power in range(degree, -1, -1):
+                column = n_cols - 1 - power
+                for letter, coeffs in (('A', curves.coeffs_x), ('B', curves.coeffs_y)):
+                    name = f"{letter}_{{{group}p{power}}}"
+                    definitions.append((name, f"{name}=\\left[{render_list(coeffs[rows, column])}\\right]"))
+                    terms[letter].append(name + ('' if power == 0 else 't' if power == 1 else f't^{{{power}}}'))
+            curve = f"\\left({'+'.join(terms['A'])},{'+'.join(terms['B'])}\\right)"
+            yield definitions, curve
+
+
+def count_list_expressions(curves, limit=LIST_LIMIT):
+    """Number of expressions ``list_groups`` produces: two lists per power plus the curve, per group."""
+    degrees, counts = np.unique(effective_degrees(curves.coeffs_x, curves.coeffs_y), return_counts=True)
+    return int(np.sum(-(-counts // limit) * (2 * (degrees + 1) + 1)))
+
+
+def iter_console_list_commands(formatter):
+    """
+    Like ``iter_console_commands`` with the list-based encoding: one
+    ``setExpression`` per coefficient list and per degree group.
+    """
+    yield "Calc.setBlank();\n"
+    for group, (definitions, curve) in enumerate(list_groups(formatter.curves), 1):
+        for name, latex in definitions:
+            # Backslashes are doubled for the JavaScript string literal
+            yield ("Calc.setExpression({\n"
+                   f"                  id: 'list-{name[0]}{name[3:-1]}',\n"
+                   "                  type: 'expression',\n"
+                   f"                  latex: '{latex.replace(chr(92), chr(92) * 2)}'\n"
+                   "                });\n")
+        yield ("Calc.setExpression({\n"
+               f"                  id: 'curve-{group}',\n"
+               "                  type: 'expression',\n"
+               f"                  latex: '{curve.replace(chr(92), chr(92) * 2)}',\n"
+               "                  color: '#000000',\n"
+               "                  lineWidth: '1',\n"
+               "                  lineOpacity: '1',\n"
+               "                  parametricDomain: { min: '0', max: '1' }\n"
+               "                });\n")
+
+
+def graph_state_skeleton(width, height):
+    """Graph-state dict with an empty expression list and a viewport around the image."""
+    return {
+        "version": "9",
+        "graph": {
+            "viewport": {
+                "xmin": str(-50),
+                "ymin": str(-50),
+                "xmax": str(width + 50),
+                "ymax": str(height + 50)
+            }
+        },
+        "expressions": {
+            "list": []
+        }
+    }
+
+
+def iter_graph_state_expressions(formatter, chunk_size=CHUNK_SIZE):
+    """Yield the graph-state expression dicts: the t slider, then one per segment."""
+    yield {
+        "type": "expression",
+        "id": "t-slider",
+        "latex": "t=0.5",
+        "slider": {
+            "hardMin": True,
+            "hardMax": True,
+            "min": "0",
+            "max": "1",
+            "step": "0.01"
+        }
+    }
+
+    curve_id = 1
+    for x_exprs, y_exprs in formatter.iter_render('state', chunk_size):
+        for x_latex, y_latex in zip(x_exprs, y_exprs):
+            # Each segment gets its own parameter t_{id}
+            yield {
+                "type": "expression",
+                "id": f"curve-{curve_id}",
+                "color": "#000000",
+                "latex": f"\\left({x_latex},{y_latex}\\right)",
+                "parametricDomain": {
+                    "min": "0",
+                    "max": "1"
+                },
+                "lineOpacity": "1",
+                "lineWidth": "1"
+            }
+            curve_id += 1
+
+
+def iter_graph_state_list_expressions(formatter):
+    """Yield the graph-state expression dicts of the list-based encoding (see list_groups)."""
+    for group, (definitions, curve) in enumerate(list_groups(formatter.curves), 1):
+        for name, latex in definitions:
+            yield {
+                "type": "expression",
+                "id": f"list-{name[0]}{name[3:-1]}",
+                "latex": latex
+            }
+        yield {
+            "type": "expression",
+            "id": f"curve-{group}",
+            "color": "#000000",
+            "latex": curve,
+            "parametricDomain": {
+                "min": "0",
+                "max": "1"
+            },
+            "lineOpacity": "1",
+            "lineWidth": "1"
+        }
+
+
+def iter_graph_state_json(formatter, width, height, compact=False, lists=False, chunk_size=CHUNK_SIZE):
+    """
+    Yield the graph-state JSON document one expression at a time.
+
+    With ``compact=False`` the output is identical to
+    ``json.dump(state, f, indent=2)``; ``compact=True`` drops all optional
+    whitespace. ``lists=True`` uses the list-based encoding.
+    """
+    if compact:
+        options = {'separators': (',', ':')}
+    else:
+        options = {'indent': 2}
+
+    state = graph_state_skeleton(width, height)
+    state["expressions"]["list"].append(_EXPRESSIONS_SENTINEL)
+    head, tail = json.dumps(state, **options).split(json.dumps(_EXPRESSIONS_SENTINEL))
+    indent = '' if compact else head[head.rfind('\n') + 1:]
+    separator = ',' if compact else ',\n' + indent
+
+    yield head
+    if lists:
+        expressions = iter_graph_state_list_expressions(formatter)
+    else:
+        expressions = iter_graph_state_expressions(formatter, chunk_size)
+    for i, expression in enumerate(expressions):
+        item = json.dumps(expression, **options)
+        if indent:
+            item = item.replace('\n', '\n' + indent)
+        yield item if i == 0 else separator + item
+    yield tail
+
+
+def bezier_control_points(coeffs):
+    """
+    Exact cubic Bezier control points of polynomials of degree <= 3 on [0, 1].
+
+    ``coeffs`` has shape (n, 4), highest power first. Returns shape (n, 4):
+    P0..P3 along the last axis.
+    """
+    a, b, c, d = coeffs.T
+    return np.column_stack((d, d + c / 3, d + (2 * c + b) / 3, a + b + c + d))
+
+
+def cubic_reduction(coeffs_x, coeffs_y, pieces=1, samples=SVG_SAMPLES):
+    """
+    Piecewise cubic Bezier approximations of polynomial segments of any degree.
+
+    [0, 1] is split into ``pieces`` equal parts, each approximated by one
+    cubic whose end points lie on the segment and whose inner control points
+    are the least-squares fit over ``samples`` evenly spaced parameters.
+    Returns (px, py, error): (n, pieces, 4) control points P0..P3 and the
+    largest distance between each segment and its Beziers at those parameters.
+    """
+    s = np.linspace(0, 1, samples)
+    t = (np.arange(pieces)[:, None] + s) / pieces
+    powers = t[..., None] ** np.arange(coeffs_x.shape[1] - 1, -1, -1)
+    basis = np.column_stack(((1 - s) ** 3, 3 * (1 - s) ** 2 * s, 3 * (1 - s) * s ** 2, s ** 3))
+    # Solve for P1, P2 with P0 and P3 fixed on the segment
+    solve = np.linalg.pinv(basis[:, 1:3])
+    control, values = [], []
+    for coeffs in (coeffs_x, coeffs_y):
+        f = np.einsum('nk,psk->nps', coeffs, powers)
+        ends = f[..., [0]] * basis[:, 0] + f[..., [-1]] * basis[:, 3]
+        inner = (f - ends) @ solve.T
+        control.append(np.concatenate((f[..., [0]], inner, f[..., [-1]]), axis=-1))
+        values.append(f)
+    px, py = control
+    error = np.hypot(px @ basis.T - values[0], py @ basis.T - values[1]).max(axis=(1, 2))
+    return px, py, error
+
+
+def _segment_paths(curves, height, bezier, samples, bezier_tolerance=BEZIER_TOLERANCE):
+    """
+    Path data for every segment of ``curves``.
+
+    Returns (full, continuation, starts, ends): ``full`` path strings start
+    with a moveto, ``continuation`` strings assume the pen already sits at the
+    segment's start; ``starts``/``ends`` are the (n, 2) SVG-space endpoints.
+    """
+    n = len(curves)
+    points = np.stack(curves.evaluate(np.linspace(0, 1, samples)), axis=-1)
+    points[..., 1] = height - points[..., 1]
+    template = "M%.2f,%.2f" + " %.2f,%.2f" * (samples - 1) + "\n"
+    full = ((template * n) % tuple(points.ravel().tolist())).split("\n")[:-1]
+    continuation = ["L" + path[path.index(" ") + 1:] if samples > 1 else "" for path in full]
+
+    if bezier:
+        pad = max(0, 3 - curves.degree)
+        coeffs_x = np.pad(curves.coeffs_x, ((0, 0), (pad, 0)))
+        coeffs_y = np.pad(curves.coeffs_y, ((0, 0), (pad, 0)))
+        # Segments whose terms above t^3 vanish convert exactly; the others
+        # are split into the fewest cubics (up to BEZIER_MAX_PIECES) that stay
+        # within bezier_tolerance, or keep their sampled points
+        exact = np.flatnonzero(np.all(np.abs(coeffs_x[:, :-4]) <= 1e-10, axis=1) &
+                               np.all(np.abs(coeffs_y[:, :-4]) <= 1e-10, axis=1))
+        groups = [(exact, bezier_control_points(coeffs_x[exact, -4:])[:, None],
+                   bezier_control_points(coeffs_y[exact, -4:])[:, None])]
+        remaining = np.setdiff1d(np.arange(n), exact)
+        pieces = 1
+        while len(remaining) and pieces <= BEZIER_MAX_PIECES:
+            px, py, error = cubic_reduction(curves.coeffs_x[remaining], curves.coeffs_y[remaining],
+                                            pieces, samples)
+            fits = error <= bezier_tolerance
+            groups.append((remaining[fits], px[fits], py[fits]))
+            remaining = remaining[~fits]
+            pieces *= 2
+        for rows, px, py in groups:
+            if not len(rows):
+                continue
+            control = np.stack((px, height - py), axis=-1)
+            # Moveto P0, then P1 P2 P3 of every piece
+            values = np.concatenate((control[:, 0, 0], control[:, :, 1:].reshape(len(rows), -1)), axis=1)
+            template = "M%.2f,%.2f" + "C%.2f,%.2f %.2f,%.2f %.2f,%.2f" * px.shape[1] + "\n"
+            paths = ((template * len(rows)) % tuple(values.ravel().tolist())).split("\n")[:-1]
+            for i, path in zip(rows.tolist(), paths):
+                full[i] = path
+                continuation[i] = path[path.index("C"):]
+    return full, continuation, points[:, 0], points[:, -1]
+
+
+def iter_svg(curves, width, height, bezier=False, samples=SVG_SAMPLES, chunk_size=CHUNK_SIZE,
+             bezier_tolerance=BEZIER_TOLERANCE):
+    """
+    Yield an SVG document with one ``<path>`` per fitted contour.
+
+    Segments are sampled with one batched Horner pass and segments of the
+    same contour are merged into a single path; consecutive segments that
+    meet end to start are joined without a new moveto. With ``bezier=True``
+    segments are written as cubic Bezier commands instead of sampled points:
+    exactly for degree <= 3; higher degrees are split into the fewest
+    cubics (1, 2, 4 or 8) that stay within ``bezier_tolerance`` pixels (see
+    cubic_reduction). Segments beyond that keep their sampled points.
+    """
+    yield (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+           f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n'
+           f'<rect width="{width}" height="{height}" fill="white"/>\n'
+           '<g stroke="black" stroke-width="1" fill="none">\n')
+
+    offsets = curves.curve_offsets
+    first_curve = 0
+    while first_curve < curves.n_curves:
+        # Whole curves per block, roughly chunk_size segments each
+        last_curve = max(first_curve + 1,
+                         int(np.searchsorted(offsets, offsets[first_curve] + chunk_size, side='right')) - 1)
+        last_curve = min(last_curve, curves.n_curves)
+        start, stop = offsets[first_curve], offsets[last_curve]
+        full, continuation, starts, ends = _segment_paths(curves.subset(start, stop), height, bezier, samples,
+                                                         bezier_tolerance)
+        joined = np.zeros(stop - start, dtype=bool)
+        joined[1:] = np.all(np.abs(starts[1:] - ends[:-1]) <= _JOIN_TOLERANCE, axis=1)
+
+        parts = []
+        for curve in range(first_curve, last_curve):
+            lo, hi = offsets[curve] - start, offsets[curve + 1] - start
+            data = [full[lo]] + [continuation[i] if joined[i] else full[i] for i in range(lo + 1, hi)]
+            parts.append(f'<path d="{"".join(data)}"/>\n')
+        yield ''.join(parts)
+        first_curve = last_curve
+
+    yield '</g>\n</svg>'
@@ -0,0 +1,425 @@
+"""
+Batched polynomial fitting for parametric contour segments.
+
+Every segment is interpolated over the fixed nodes ``linspace(0, 1, n)``, so
+the interpolating polynomial is a linear map of the sampled coordinates. The
+inverse Vandermonde matrix for those nodes is computed once per node count and
+all windows of all contours are solved with a single matrix product.
+
+``fit_sliding_windows`` cuts contours into fixed windows; ``fit_adaptive``
+grows variable-length segments up to a deviation tolerance in pixels.
+
+With a ``degree``, segments are least-squares fits instead of interpolants:
+runs of any length are fitted with a fixed low-degree polynomial through the
+run's endpoints (so consecutive segments still join), expressed in a
+Chebyshev basis while solving for conditioning and converted to power form
+for export. The segment length no longer sets the degree.
+"""
+from functools import lru_cache
+
+import numpy as np
+from numpy.polynomial import chebyshev, polynomial
+
+
+@lru_cache(maxsize=None)
+def lagrange_basis_matrix(n_nodes):
+    """
+    Inverse Vandermonde matrix for ``n_nodes`` equally spaced nodes on [0, 1].
+
+    Rows of ``windows @ M.T`` are the interpolating polynomial coefficients,
+    highest power first (the same ordering as ``np.poly1d``).
+    """
+    t = np.linspace(0, 1, n_nodes)
+    matrix = np.linalg.inv(np.vander(t, n_nodes))
+    matrix.setflags(write=False)
+    return matrix
+
+
+def interpolate_windows(windows):
+    """
+    Interpolate every row of ``windows`` (shape ``(n_windows, n_nodes)``).
+
+    Returns coefficients of shape ``(n_windows, n_nodes)``, highest power first.
+    """
+    windows = np.asarray(windows, dtype=float)
+    return windows @ lagrange_basis_matrix(windows.shape[1]).T
+
+
+def _stack_contours(contours):
+    """Concatenate contours into one (N, 2) float array plus offsets/lengths."""
+    lengths = np.array([len(c) for c in contours], dtype=np.int64)
+    if len(contours) == 0 or lengths.sum() == 0:
+        return np.empty((0, 2)), np.zeros(0, dtype=np.int64), lengths
+    points = np.concatenate([np.asarray(c).reshape(-1, 2) for c in contours]).astype(float)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return points, offsets, lengths
+
+
+def segment_counts(lengths, segment_size=5, degree=None):
+    """Segments the fixed-window fit produces for contours of ``lengths`` points."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if degree is not None:
+        # Least-squares windows share endpoints: stride segment_size - 1
+        stride = max(1, int(segment_size) - 1)
+        return np.where(lengths >= 2, -(-(lengths - 1) // stride), 0)
+    stride = max(1, int(segment_size) - 2)
+    windows = (lengths - segment_size) // stride + 1
+    return np.where(lengths > segment_size, windows, (lengths >= 2).astype(np.int64))
+
+
+def count_segments(contours, height, segment_size=5, tolerance=None, degree=None):
+    """Segments per contour that ``fit_contours`` produces with these options."""
+    if tolerance is None:
+        return segment_counts([len(c) for c in contours], segment_size, degree)
+    contour_index = fit_adaptive(contours, height, segment_size, tolerance, degree)[0]
+    return np.bincount(contour_index, minlength=len(contours))
+
+
+def fit_contours(contours, height, segment_size=5, tolerance=None, degree=None):
+    """
+    Fit every contour with the requested strategy.
+
+    - no tolerance, no degree: interpolating sliding windows (``fit_sliding_windows``)
+    - no tolerance, degree: least-squares windows of ``segment_size`` points
+    - tolerance: adaptive segments within ``tolerance`` pixels (``fit_adaptive``),
+      interpolating or least-squares depending on ``degree``
+    """
+    if tolerance is not None:
+        return fit_adaptive(contours, height, segment_size, tolerance, degree)
+    if degree is not None:
+        return fit_least_squares_windows(contours, height, segment_size, degree)
+    return fit_sliding_windows(contours, height, segment_size)
+
+
+def fit_sliding_windows(contours, height, segment_size=5):
+    """
+    Fit interpolating polynomials to sliding windows over every contour.
+
+    Mirrors the historical per-window ``scipy.interpolate.lagrange`` loop:
+    contours with at most ``segment_size`` points get one polynomial through
+    all of their points, longer contours get windows of ``segment_size``
+    points with stride ``segment_size - 2``. Y coordinates are flipped so
+    that the origin sits at the bottom-left corner, as Desmos expects.
+
+    Parameters:
+    - contours: Sequence of OpenCV contours (arrays reshaped to (-1, 2))
+    - height: Image height used for the y flip
+    - segment_size: Points per interpolation window
+
+    Returns ``(contour_index, t_range, coeffs_x, coeffs_y)`` where
+    ``contour_index`` has shape (n_segments,), ``t_range`` (n_segments, 2) and
+    the coefficient arrays (n_segments, segment_size). Segments of short
+    contours are left-padded with zeros so every row shares one degree.
+    """
+    segment_size = int(segment_size)
+    points, offsets, lengths = _stack_contours(contours)
+    if len(points):
+        points[:, 1] = height - points[:, 1]
+
+    index_parts, range_parts, cx_parts, cy_parts = [], [], [], []
+
+    # Short contours: one polynomial through all points, grouped by length so
+    # that each group is a single batched product.
+    short = np.flatnonzero((lengths >= 2) & (lengths <= segment_size))
+    for n_nodes in np.unique(lengths[short]):
+        members = short[lengths[short] == n_nodes]
+        idx = offsets[members, None] + np.arange(n_nodes)
+        pad = ((0, 0), (segment_size - n_nodes, 0))
+        cx_parts.append(np.pad(interpolate_windows(points[idx, 0]), pad))
+        cy_parts.append(np.pad(interpolate_windows(points[idx, 1]), pad))
+        index_parts.append(members)
+        range_parts.append(np.tile([0.0, 1.0], (len(members), 1)))
+
+    # Long contours: fixed-size windows with overlapping endpoints.
+    long_ = np.flatnonzero(lengths > segment_size)
+    if len(long_):
+        stride = max(1, segment_size - 2)
+        n_windows = (lengths[long_] - segment_size) // stride + 1
+        members = np.repeat(long_, n_windows)
+        first = np.repeat(np.cumsum(n_windows) - n_windows, n_windows)
+        starts = stride * (np.arange(n_windows.sum()) - first)
+        idx = (offsets[members] + starts)[:, None] + np.arange(segment_size)
+        span = (lengths[members] - 1).astype(float)
+        cx_parts.append(interpolate_windows(points[idx, 0]))
+        cy_parts.append(interpolate_windows(points[idx, 1]))
+        index_parts.append(members)
+        range_parts.append(np.column_stack((starts / span, (starts + segment_size) / span)))
+
+    if not index_parts:
+        empty = np.empty((0, segment_size))
+        return np.zeros(0, dtype=np.int64), np.empty((0, 2)), empty, empty.copy()
+
+    contour_index = np.concatenate(index_parts)
+    order = np.argsort(contour_index, kind='stable')
+    return (contour_index[order],
+            np.concatenate(range_parts)[order],
+            np.concatenate(cx_parts)[order],
+            np.concatenate(cy_parts)[order])
+
+
+# Polyline edges are sampled at least this densely (pixels) when fitting runs
+# and checking their deviation
+SAMPLE_SPACING = 2.0
+
+
+def _prepare(contours, height):
+    """
+    Stacked, y-flipped points plus per-point polyline data.
+
+    Returns (points, offsets, lengths, polyline) with ``polyline = (arc,
+    subsamples)``: ``arc`` is the cumulative polyline length at every point
+    of a contour; ``subsamples`` is the cumulative count of sample intervals
+    before every point, edge ``i -> i+1`` being split into
+    ``max(2, ceil(length / SAMPLE_SPACING))`` intervals.
+    """
+    points, offsets, lengths = _stack_contours(contours)
+    if len(points):
+        points[:, 1] = height - points[:, 1]
+    edge = np.zeros(len(points))
+    if len(points) > 1:
+        edge[:-1] = np.hypot(*np.diff(points, axis=0).T)
+    edge[offsets + lengths - 1] = 0.0
+    arc = np.concatenate(([0.0], np.cumsum(edge)[:-1])) if len(points) else edge
+    intervals = np.maximum(2, np.ceil(edge / SAMPLE_SPACING)).astype(np.int64)
+    subsamples = np.concatenate(([0], np.cumsum(intervals)[:-1])) if len(points) else intervals
+    return points, offsets, lengths, (arc, subsamples)
+
+
+def _run_samples(points, polyline, starts, ends, chord):
+    """
+    Sample every run densely along its polyline.
+
+    Returns (row, t, target, bounds): the run of each sample, its curve
+    parameter, the polyline point, and the first sample of each run. With
+    ``chord`` the parameter follows arc length, otherwise the point index.
+    """
+    arc, subsamples = polyline
+    n_samples = subsamples[ends] - subsamples[starts] + 1
+    bounds = np.cumsum(n_samples) - n_samples
+    row = np.repeat(np.arange(len(starts)), n_samples)
+    position = subsamples[starts][row] + np.arange(n_samples.sum()) - np.repeat(bounds, n_samples)
+
+    vertex = np.searchsorted(subsamples, position, side='right') - 1
+    vertex = np.minimum(vertex, ends[row])
+    following = np.minimum(vertex + 1, len(points) - 1)
+    interval = np.maximum(subsamples[following] - subsamples[vertex], 1)
+    fraction = np.where(vertex < ends[row], (position - subsamples[vertex]) / interval, 0.0)
+    target = points[vertex] + fraction[:, None] * (points[following] - points[vertex])
+
+    if chord:
+        along = arc[vertex] + fraction * (arc[following] - arc[vertex]) - arc[starts[row]]
+        length = (arc[ends] - arc[starts])[row]
+        measurable = length > 0
+        if not measurable.all():
+            along = np.where(measurable, along, vertex + fraction - starts[row])
+            length = np.where(measurable, length, (ends - starts)[row])
+        t = along / length
+    else:
+        t = (vertex + fraction - starts[row]) / (ends - starts)[row]
+    return row, t, target, bounds
+
+
+def _interpolate_runs(points, starts, ends, n_nodes):
+    """
+    Interpolate ``n_nodes`` points spread evenly over each run ``starts..ends``.
+
+    Runs are inclusive index ranges into ``points``; the run parameter is
+    ``t = (i - start) / (end - start)``. Runs shorter than ``n_nodes`` use all
+    of their points. Returns (coeffs_x, coeffs_y) of shape (n_runs, n_nodes),
+    highest power first, lower degrees left-padded with zeros.
+    """
+    span = ends - starts
+    coeffs_x = np.zeros((len(starts), n_nodes))
+    coeffs_y = np.zeros((len(starts), n_nodes))
+    m_nodes = np.minimum(span + 1, n_nodes)
+    for m in np.unique(m_nodes):
+        rows = np.flatnonzero(m_nodes == m)
+        offsets = np.rint(np.linspace(0, 1, m) * span[rows, None]).astype(np.int64)
+        t = offsets / span[rows, None]
+        values = points[starts[rows, None] + offsets]
+        # Batched Vandermonde solve: nodes differ per run once rounded
+        vander = t[..., None] ** np.arange(m - 1, -1, -1)
+        coeffs = np.linalg.solve(vander, values)
+        coeffs_x[rows, n_nodes - m:] = coeffs[..., 0]
+        coeffs_y[rows, n_nodes - m:] = coeffs[..., 1]
+    return coeffs_x, coeffs_y
+
+
+@lru_cache(maxsize=None)
+def bubble_basis_matrix(degree):
+    """
+    Power-form coefficients of the basis ``t(1-t) T_k(2t-1)``, k < degree - 1.
+
+    Returns shape (degree + 1, degree - 1), highest power first; column k
+    holds basis function k. The factor t(1-t) vanishes at both ends, so
+    adding these to the chord through a run's endpoints keeps them fixed.
+    """
+    matrix = np.zeros((degree + 1, max(degree - 1, 0)))
+    bubble = np.array([0.0, 1.0, -1.0])  # t - t^2, lowest power first
+    for k in range(degree - 1):
+        # T_k(u) in powers of u, then u = 2t - 1 substituted by Horner's rule
+        in_u = chebyshev.cheb2poly(np.eye(k + 1)[k])
+        in_t = np.zeros(1)
+        for c in in_u[::-1]:
+            in_t = polynomial.polyadd(polynomial.polymul(in_t, [-1.0, 2.0]), [c])
+        column = polynomial.polymul(bubble, in_t)
+        matrix[degree + 1 - len(column):, k] = column[::-1]
+    matrix.setflags(write=False)
+    return matrix
+
+
+def _least_squares_runs(points, polyline, starts, ends, degree):
+    """
+    Least-squares polynomials of ``degree`` through each run's endpoints.
+
+    Each run is fitted at dense samples along its polyline, parameterized by
+    arc length. The curve is the chord between the run's endpoints plus a
+    combination of ``t(1-t) T_k(2t-1)`` terms solved by batched least
+    squares. Returns (coeffs_x, coeffs_y) of shape (n_runs, degree + 1),
+    highest power first.
+    """
+    row, t, target, bounds = _run_samples(points, polyline, starts, ends, chord=True)
+    first, last = points[starts], points[ends]
+    n_runs = len(starts)
+
+    coeffs = np.zeros((n_runs, degree + 1, 2))
+    coeffs[:, -1] = first
+    coeffs[:, -2] = last - first
+    if degree >= 2:
+        # Residual after the chord, fitted with the endpoint-preserving basis
+        residual = target - (first[row] + (last - first)[row] * t[:, None])
+        basis = (t * (1 - t))[:, None] * chebyshev.chebvander(2 * t - 1, degree - 2)
+        gram = np.add.reduceat(basis[:, :, None] * basis[:, None, :], bounds)
+        rhs = np.add.reduceat(basis[:, :, None] * residual[:, None, :], bounds)
+        # Pseudo-inverse: short runs have fewer samples than basis functions
+        weights = np.linalg.pinv(gram) @ rhs
+        coeffs += bubble_basis_matrix(degree) @ weights
+    return coeffs[..., 0], coeffs[..., 1]
+
+
+def _max_deviation(points, polyline, starts, ends, coeffs_x, coeffs_y, chord=False):
+    """
+    Largest distance between each run's polynomial and its polyline, checked
+    at samples at most SAMPLE_SPACING apart (at least two per edge).
+    """
+    row, t, target, bounds = _run_samples(points, polyline, starts, ends, chord)
+    x = np.zeros(len(t))
+    y = np.zeros(len(t))
+    for j in range(coeffs_x.shape[1]):
+        x = x * t + coeffs_x[row, j]
+        y = y * t + coeffs_y[row, j]
+    deviation = np.hypot(x - target[:, 0], y - target[:, 1])
+    return np.maximum.reduceat(deviation, bounds)
+
+
+def _fit_runs(points, polyline, starts, ends, segment_size, degree):
+    if degree is None:
+        return _interpolate_runs(points, starts, ends, segment_size)
+    return _least_squares_runs(points, polyline, starts, ends, degree)
+
+
+def _collect(parts, width):
+    """Concatenate per-batch results and order the segments by contour."""
+    index_parts, range_parts, cx_parts, cy_parts = parts
+    if not index_parts:
+        empty = np.empty((0, width))
+        return np.zeros(0, dtype=np.int64), np.empty((0, 2)), empty, empty.copy()
+    contour_index = np.concatenate(index_parts)
+    order = np.argsort(contour_index, kind='stable')
+    return (contour_index[order],
+            np.concatenate(range_parts)[order],
+            np.concatenate(cx_parts)[order],
+            np.concatenate(cy_parts)[order])
+
+
+def fit_least_squares_windows(contours, height, segment_size=5, degree=3):
+    """
+    Least-squares polynomials of ``degree`` over consecutive runs of
+    ``segment_size`` points (the last run of a contour may be shorter).
+
+    Runs share their endpoints, and every polynomial passes through them,
+    so segments join without gaps. Returns the same tuple as
+    ``fit_sliding_windows``.
+    """
+    degree = max(1, int(degree))
+    points, offsets, lengths, polyline = _prepare(contours, height)
+    counts = segment_counts(lengths, segment_size, degree)
+    stride = max(1, int(segment_size) - 1)
+
+    members = np.repeat(np.arange(len(lengths)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    local = stride * (np.arange(counts.sum()) - first)
+    starts = offsets[members] + local
+    ends = np.minimum(starts + stride, offsets[members] + lengths[members] - 1)
+    cx, cy = _least_squares_runs(points, polyline, starts, ends, degree)
+
+    span = (lengths[members] - 1).astype(float)
+    t_range = np.column_stack((local / span, (ends - offsets[members]) / span)) if len(members) else np.empty((0, 2))
+    return _collect(([members], [t_range], [cx], [cy]), degree + 1)
+
+
+def fit_adaptive(contours, height, segment_size=5, tolerance=1.0, degree=None):
+    """
+    Fit variable-length segments whose deviation stays within ``tolerance`` pixels.
+
+    Each segment starts where the previous one ended and grows greedily:
+    its end is pushed forward (doubling, then bisecting) as long as the
+    segment's polynomial stays within ``tolerance`` of the polyline. The
+    polynomial interpolates ``segment_size`` evenly spread points of the run,
+    or with ``degree`` is a least-squares fit of that degree. Straight or
+    gently curved runs collapse into a single segment; tight curves get
+    short ones. All contours advance in lockstep so every trial is one
+    batched solve.
+
+    Returns the same ``(contour_index, t_range, coeffs_x, coeffs_y)`` tuple
+    as ``fit_sliding_windows``.
+    """
+    segment_size = int(segment_size)
+    if degree is not None:
+        degree = max(1, int(degree))
+    points, offsets, lengths, polyline = _prepare(contours, height)
+
+    active = np.flatnonzero(lengths >= 2)
+    cursor = offsets[active].copy()
+    last = offsets[active] + lengths[active] - 1
+    parts = ([], [], [], [])
+
+    def fits(starts, ends):
+        cx, cy = _fit_runs(points, polyline, starts, ends, segment_size, degree)
+        deviation = _max_deviation(points, polyline, starts, ends, cx, cy, chord=degree is not None)
+        return deviation <= tolerance
+
+    while len(active):
+        # Exponential search for a failing end, then bisect between the bounds
+        good = cursor + 1
+        step = np.full(len(active), 2, dtype=np.int64)
+        bad = np.full(len(active), -1, dtype=np.int64)
+        growing = good < last
+        while growing.any():
+            rows = np.flatnonzero(growing)
+            trial = np.minimum(cursor[rows] + step[rows], last[rows])
+            ok = fits(cursor[rows], trial)
+            good[rows[ok]] = trial[ok]
+            bad[rows[~ok]] = trial[~ok]
+            step[rows] *= 2
+            growing[rows] = ok & (trial < last[rows])
+        searching = bad > good + 1
+        while searching.any():
+            rows = np.flatnonzero(searching)
+            trial = (good[rows] + bad[rows]) // 2
+            ok = fits(cursor[rows], trial)
+            good[rows[ok]] = trial[ok]
+            bad[rows[~ok]] = trial[~ok]
+            searching[rows] = bad[rows] > good[rows] + 1
+
+        cx, cy = _fit_runs(points, polyline, cursor, good, segment_size, degree)
+        start_offset = offsets[active]
+        span = (lengths[active] - 1).astype(float)
+        for part, value in zip(parts, (active, np.column_stack(((cursor - start_offset) / span,
+                                                                  (good - start_offset) / span)), cx, cy)):
+            part.append(value)
+
+        remaining = good < last
+        active, cursor, last = active[remaining], good[remaining], last[remaining]
+
+    return _collect(parts, segment_size if degree is None else degree + 1)
@@ -0,0 +1,154 @@
+"""
+Shared text/LaTeX rendering of CurveSet coefficients for the Desmos exporters.
+
+Rows of the coefficient matrix are grouped by their pattern of dropped and
+negative terms; each group is rendered with a single ``%`` formatting call
+over all of its rows. Rendered dialects are cached on the formatter, so
+producing several export formats from one CurveSet renders each dialect
+exactly once.
+
+``render_list`` writes coefficient columns as Desmos list literals for the
+list-based encoding (see exporters.list_groups).
+"""
+import numpy as np
+
+
+# Coefficients at or below this magnitude are dropped from the expressions
+ZERO_TOLERANCE = 1e-10
+
+# Output dialects:
+# - text:   plain text, "1.0000*t^2 - 3.0000*t + 4.0000"
+# - latex:  Desmos console LaTeX, "1.000000t^{2}-3.000000t+4.000000"
+# - state:  graph-state LaTeX with a per-segment parameter, "1.000000t_{7}^{2}..."
+DIALECTS = {
+    'text': {'precision': 4, 't': '*t', 'power': '*t^{power}', 'plus': ' + ', 'minus': ' - '},
+    'latex': {'precision': 6, 't': 't', 'power': 't^{{{power}}}', 'plus': '+', 'minus': '-'},
+    'state': {'precision': 6, 't': 't_{{{id}}}', 'power': 't_{{{id}}}^{{{power}}}', 'plus': '+', 'minus': '-'},
+}
+
+
+def render_polynomials(coeffs, dialect, ids=None):
+    """
+    Render each row of ``coeffs`` (highest power first) as a polynomial string.
+
+    Parameters:
+    - coeffs: float array of shape (n_segments, degree + 1)
+    - dialect: Key of DIALECTS
+    - ids: Per-row parameter ids for dialects that use ``t_{id}``
+           (default: 1..n_segments)
+
+    Terms with ``|coeff| <= ZERO_TOLERANCE`` are dropped and negative terms
+    are joined with the dialect's minus operator. Returns a list of strings.
+    """
+    if dialect not in DIALECTS:
+        raise ValueError(f"Unknown dialect '{dialect}', expected one of {sorted(DIALECTS)}")
+    spec = DIALECTS[dialect]
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    n_rows, n_cols = coeffs.shape
+    if n_rows == 0:
+        return []
+    if ids is None:
+        ids = np.arange(1, n_rows + 1)
+    ids = np.asarray(ids, dtype=np.float64)
+    per_segment = '{id}' in spec['t']
+    value = f"%.{spec['precision']}f"
+
+    kept = np.abs(coeffs) > ZERO_TOLERANCE
+    negative = kept & (coeffs < 0)
+    shifts = 2 * np.arange(n_cols, dtype=np.int64)
+    pattern = ((kept.astype(np.int64) | negative.astype(np.int64) << 1) << shifts).sum(axis=1)
+
+    rendered = np.empty(n_rows, dtype=object)
+    for key in np.unique(pattern):
+        rows = np.flatnonzero(pattern == key)
+        cols = np.flatnonzero(kept[rows[0]])
+        if len(cols) == 0:
+            rendered[rows] = ''
+            continue
+
+        template, args = [], []
+        for position, col in enumerate(cols):
+            power = n_cols - 1 - col
+            if negative[rows[0], col]:
+                template.append('-' if position == 0 else spec['minus'])
+            elif position > 0:
+                template.append(spec['plus'])
+            template.append(value)
+            args.append(np.abs(coeffs[rows, col]))
+            if power >= 1:
+                suffix = (spec['t'] if power == 1 else spec['power']).format(power=power, id='{id}')
+                if per_segment:
+                    template.append(suffix.replace('{id}', '%d'))
+                    args.append(ids[rows])
+                else:
+                    template.append(suffix)
+        template = ''.join(template) + '\n'
+        values = np.column_stack(args).ravel().tolist()
+        rendered[rows] = ((template * len(rows)) % tuple(values)).split('\n')[:-1]
+    return rendered.tolist()
+
+
+def render_list(values, precision=6):
+    """
+    Desmos list literal body for ``values``: "1.5,-0.25,0,..."
+
+    Values are written with ``precision`` decimals and trailing zeros
+    stripped; magnitudes at or below ZERO_TOLERANCE become 0.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.abs(values) > ZERO_TOLERANCE, values, 0.0)
+    text = np.char.rstrip(np.char.rstrip(np.char.mod(f'%.{precision}f', values), '0'), '.')
+    text[(text == '-0') | (text == '')] = '0'
+    return ','.join(text.tolist())
+
+
+def effective_degrees(coeffs_x, coeffs_y):
+    """Highest power with a coefficient above ZERO_TOLERANCE in x or y, per segment."""
+    kept = (np.abs(coeffs_x) > ZERO_TOLERANCE) | (np.abs(coeffs_y) > ZERO_TOLERANCE)
+    n_cols = kept.shape[1]
+    first = np.where(kept.any(axis=1), kept.argmax(axis=1), n_cols - 1)
+    return n_cols - 1 - first
+
+
+class CurveFormatter:
+    """
+    Renders the segments of a CurveSet as Desmos expression strings.
+
+    Usage:
+        formatter = CurveFormatter(curves)
+        x_exprs, y_exprs = formatter.render('latex')
+    """
+
+    def __init__(self, curves):
+        self.curves = curves
+        self._rendered = {}
+
+    def render(self, dialect):
+        """
+        Render every segment in ``dialect`` ('text', 'latex' or 'state').
+
+        Returns (x_exprs, y_exprs): lists with one string per segment. In the
+        'state' dialect segment ``i`` uses the parameter ``t_{i+1}``.
+        """
+        if dialect not in self._rendered:
+            self._rendered[dialect] = (render_polynomials(self.curves.coeffs_x, dialect),
+                                       render_polynomials(self.curves.coeffs_y, dialect))
+        return self._rendered[dialect]
+
+    def iter_render(self, dialect, chunk_size=4096):
+        """
+        Yield (x_exprs, y_exprs) blocks of at most ``chunk_size`` segments.
+
+        Served from the cache when ``dialect`` was already rendered; otherwise
+        each block is rendered on the fly and discarded, keeping memory flat.
+        """
+        if dialect in self._rendered:
+            x_exprs, y_exprs = self._rendered[dialect]
+            for start in range(0, len(x_exprs), chunk_size):
+                yield x_exprs[start:start + chunk_size], y_exprs[start:start + chunk_size]
+            return
+        for start in range(0, len(self.curves), chunk_size):
+            stop = min(start + chunk_size, len(self.curves))
+            ids = np.arange(start + 1, stop + 1)
+            yield (render_polynomials(self.curves.coeffs_x[start:stop], dialect, ids),
+                   render_polynomials(self.curves.coeffs_y[start:stop], dialect, ids))
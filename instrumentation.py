@@ -0,0 +1,111 @@
+"""
+Per-stage instrumentation for the converter pipeline.
+
+Every cached stage and every export of ``ImageToDesmosConverter`` appends a
+record to ``converter.metrics``: wall and CPU time, memory, and the item
+counts after the step (pixels, contours, points, segments, bytes written).
+
+Memory is reported two ways. ``rss_peak_kb`` is the process's peak resident
+set size, and ``rss_growth_kb`` is how far the step raised it; the OS only
+exposes a high-water mark, so steps that stay below an earlier peak report
+0. If ``tracemalloc`` is tracing (``python -X tracemalloc`` or
+``tracemalloc.start()``), ``traced_peak_kb`` is also set: the peak of
+Python-tracked allocations above the step's starting point, which includes
+NumPy arrays.
+"""
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+COUNTS = ('pixels', 'contours', 'points', 'segments', 'bytes_written')
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class PipelineMetrics:
+    """
+    Records of the steps run by one converter, in order.
+
+    Attributes:
+    - stages: One dict per step: stage, cached (None for exports), wall_ms,
+      cpu_ms, rss_peak_kb, rss_growth_kb, traced_peak_kb and the counts in
+      ``COUNTS``. A step that runs twice gets two records.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._open = {}
+
+    def start(self, name, bytes_written=0):
+        traced = None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        self._open[name] = (time.perf_counter(), time.process_time(), peak_rss_kb(), traced, bytes_written)
+
+    def end(self, name, counts, cached=None):
+        """Close the step opened by ``start(name)``; ``counts`` is a dict of ``COUNTS``."""
+        if name not in self._open:
+            return None
+        wall, cpu, rss_before, traced_before, written_before = self._open.pop(name)
+        rss = peak_rss_kb()
+        record = {
+            'stage': name,
+            'cached': cached,
+            'wall_ms': round((time.perf_counter() - wall) * 1000, 2),
+            'cpu_ms': round((time.process_time() - cpu) * 1000, 2),
+            'rss_peak_kb': rss,
+            'rss_growth_kb': None if rss is None else rss - rss_before,
+            'traced_peak_kb': None,
+        }
+        if traced_before is not None and tracemalloc.is_tracing():
+            record['traced_peak_kb'] = max(0, tracemalloc.get_traced_memory()[1] - traced_before) // 1024
+        record.update(counts)
+        record['bytes_written'] = counts.get('bytes_written', 0) - written_before
+        self.stages.append(record)
+        return record
+
+    def totals(self):
+        """Summed times and bytes, peak memory and the final counts over all steps."""
+        if not self.stages:
+            return {}
+        last = self.stages[-1]
+        totals = {
+            'wall_ms': round(sum(r['wall_ms'] for r in self.stages), 2),
+            'cpu_ms': round(sum(r['cpu_ms'] for r in self.stages), 2),
+            'rss_peak_kb': last['rss_peak_kb'],
+            'bytes_written': sum(r['bytes_written'] for r in self.stages),
+        }
+        totals.update({key: last[key] for key in ('pixels', 'contours', 'points', 'segments')})
+        return totals
+
+    def slowest(self):
+        """Record with the largest wall time (None before any step ran)."""
+        return max(self.stages, key=lambda r: r['wall_ms'], default=None)
+
+    def to_dict(self):
+        return {'stages': list(self.stages), 'totals': self.totals()}
+
+    def format_table(self):
+        """Plain-text table of the records, for logs."""
+        lines = [f"{'stage':18}{'wall ms':>10}{'cpu ms':>10}{'rss+ KiB':>10}"
+                 f"{'contours':>10}{'points':>10}{'segments':>10}{'bytes':>12}"]
+        for r in self.stages:
+            name = r['stage'] + (' (cached)' if r['cached'] else '')
+            growth = '' if r['rss_growth_kb'] is None else r['rss_growth_kb']
+            lines.append(f"{name:18}{r['wall_ms']:>10.1f}{r['cpu_ms']:>10.1f}{growth:>10}"
+                         f"{r['contours']:>10}{r['points']:>10}{r['segments']:>10}{r['bytes_written']:>12}")
+        return "\n".join(lines)
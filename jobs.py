@@ -0,0 +1,225 @@
+"""
+Local job queue backed by a process pool.
+
+Conversions run in worker processes instead of web request threads. The
+queue bounds the number of jobs waiting or running; when it is full,
+``submit`` raises QueueFull and the web app answers 429 so clients back off.
+
+Code running inside a job can publish progress events with
+``report_progress``. Events are relayed to the parent process and collected
+per job (see ``JobQueue.wait_events``). The same call raises JobCancelled
+once the job has been cancelled, so a running conversion stops at its next
+stage boundary.
+"""
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds ``max_pending`` unfinished jobs."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+# Worker-process state, set by _init_worker and _run_job
+_worker_events = None
+_worker_cancelled = None
+_current_job = None
+
+
+def _init_worker(events, cancelled, initializer, initargs):
+    global _worker_events, _worker_cancelled
+    _worker_events = events
+    _worker_cancelled = cancelled
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_job(job_id, fn, args):
+    global _current_job
+    _current_job = job_id
+    try:
+        return fn(*args)
+    finally:
+        _current_job = None
+
+
+def report_progress(event):
+    """
+    Publish a progress event for the job running in this worker.
+
+    Raises JobCancelled if the job was cancelled. Outside a job this does
+    nothing, so it can be passed as a progress callback unconditionally.
+    """
+    if _current_job is None:
+        return
+    if _worker_cancelled.get(_current_job):
+        raise JobCancelled("Job was cancelled")
+    _worker_events.put((_current_job, event))
+
+
+class JobQueue:
+    """
+    Bounded job queue with a ProcessPoolExecutor behind it.
+
+    Parameters:
+    - max_workers: Worker processes (concurrent conversions)
+    - max_pending: Unfinished jobs (queued + running) accepted before
+                   submit raises QueueFull
+    - retention: Seconds finished jobs are kept for status/result lookups
+    - initializer, initargs: Run once in every worker process
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, retention=3600,
+                 initializer=None, initargs=()):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._manager = multiprocessing.Manager()
+        self._events = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker,
+            initargs=(self._events, self._cancelled, initializer, initargs))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        threading.Thread(target=self._relay_events, daemon=True).start()
+
+    def submit(self, fn, *args, on_done=None):
+        """
+        Enqueue ``fn(*args)`` in a worker process and return the job id.
+
+        ``on_done(job)`` runs in the parent process when the job finishes,
+        before its status turns to done/failed; ``job['error']`` is set if it
+        failed or was cancelled.
+        """
+        with self._lock:
+            self._purge()
+            if self._pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs already waiting")
+            job_id = uuid.uuid4().hex
+            job = {'id': job_id, 'created': time.time(), 'finished': None,
+                   'result': None, 'error': None, 'cancelled': False,
+                   'events': [], 'future': None}
+            self._jobs[job_id] = job
+            job['future'] = self._executor.submit(_run_job, job_id, fn, args)
+
+        def finish(future):
+            # A cancel that arrives after the last progress report does not
+            # stop the job; it only counts as cancelled if it actually ended so
+            if future.cancelled() or isinstance(future.exception(), JobCancelled):
+                job['cancelled'] = True
+                job['error'] = 'Job was cancelled'
+            elif future.exception() is not None:
+                job['error'] = str(future.exception())
+            else:
+                job['result'] = future.result()
+            try:
+                # Before 'done' is reported, so whatever on_done stores is in place
+                if on_done is not None:
+                    on_done(job)
+            finally:
+                with self._changed:
+                    # Set last: status() reports 'done' as soon as this is present
+                    job['finished'] = time.time()
+                    self._changed.notify_all()
+                self._cancelled.pop(job_id, None)
+
+        job['future'].add_done_callback(finish)
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are dropped at once; running jobs stop at
+        their next progress report (a job past its last report finishes as
+        done). Returns False for unknown or finished jobs.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job['finished'] is not None:
+            return False
+        if not job['future'].cancel():
+            self._cancelled[job_id] = True
+        return True
+
+    def pending(self):
+        """Number of jobs not finished yet."""
+        with self._lock:
+            return self._pending()
+
+    def _pending(self):
+        # Callers hold _lock: request threads add and purge jobs concurrently
+        return sum(1 for job in self._jobs.values() if job['finished'] is None)
+
+    def get(self, job_id):
+        """The job record for ``job_id`` or None."""
+        return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        """JSON-serializable status of a job, or None if unknown."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job['finished'] is not None:
+            if job['cancelled']:
+                state = 'cancelled'
+            else:
+                state = 'failed' if job['error'] else 'done'
+        elif job['future'].running():
+            state = 'running'
+        else:
+            state = 'queued'
+        end = job['finished'] or time.time()
+        status = {'job_id': job_id, 'status': state,
+                  'elapsed_ms': round((end - job['created']) * 1000)}
+        if job['events']:
+            status['progress'] = job['events'][-1]
+        if job['error']:
+            status['error'] = job['error']
+        return status
+
+    def wait_events(self, job_id, since=0, timeout=15):
+        """
+        Wait up to ``timeout`` seconds for events past index ``since``.
+
+        Returns (events, finished); (None, True) for unknown jobs.
+        """
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None, True
+            self._changed.wait_for(
+                lambda: len(job['events']) > since or job['finished'] is not None, timeout)
+            return job['events'][since:], job['finished'] is not None
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.max_workers, 'max_pending': self.max_pending,
+                    'pending': self._pending(), 'tracked': len(self._jobs)}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        self._manager.shutdown()
+
+    def _relay_events(self):
+        while True:
+            try:
+                job_id, event = self._events.get()
+            except (EOFError, OSError):
+                return
+            with self._changed:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job['events'].append(event)
+                    self._changed.notify_all()
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j for j, job in self._jobs.items()
+                       if job['finished'] is not None and job['finished'] < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,188 @@
+"""
+In-process Prometheus metrics for the web app.
+
+Counters and histograms live in the web process and are rendered in the
+Prometheus text exposition format (version 0.0.4) by ``GET /metrics``.
+Pipeline stage latencies are not measured again here: they are taken from
+the per-stage records every conversion already returns in
+``payload['metrics']`` (see instrumentation.py), once per finished job, so
+observing them costs a few dictionary updates per conversion.
+"""
+import math
+import threading
+
+
+# Seconds; the pipeline's stages range from sub-millisecond fits to
+# multi-second exports of large images
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bytes, 1 KiB to 64 MiB in factors of 4
+SIZE_BUCKETS = tuple(1024 * 4 ** k for k in range(10))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name + '_total', _labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _labels(self.labelnames, key, [('le', _number(bound))]), cumulative)
+            yield self.name + '_sum', _labels(self.labelnames, key), total
+            yield self.name + '_count', _labels(self.labelnames, key), cumulative
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self):
+        yield self.name, '', self.callback()
+
+
+class Registry:
+    """Ordered collection of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class ConverterMetrics:
+    """
+    The web app's metrics.
+
+    - desmos_stage_duration_seconds{stage}: per-stage pipeline latency
+    - desmos_conversion_duration_seconds{mode}: summed stage time per conversion
+    - desmos_conversions_total{mode, outcome}: outcome is done, cached,
+      failed or cancelled; mode is contours_only or full
+    - desmos_request_errors_total{status}: /convert requests answered with an error
+    - desmos_upload_bytes, desmos_output_bytes{mode}: upload and output file
+      sizes; exports rendered on first download are observed as they are
+      rendered (see app.render_lazy_export)
+    - gauges registered with ``gauge``
+    """
+
+    def __init__(self):
+        self.registry = Registry()
+        self.stage_duration = self.registry.register(Histogram(
+            'desmos_stage_duration_seconds', 'Wall time of each pipeline stage and export.', ('stage',)))
+        self.conversion_duration = self.registry.register(Histogram(
+            'desmos_conversion_duration_seconds', 'Summed stage wall time per conversion.', ('mode',)))
+        self.conversions = self.registry.register(Counter(
+            'desmos_conversions', 'Conversions by mode and outcome.', ('mode', 'outcome')))
+        self.request_errors = self.registry.register(Counter(
+            'desmos_request_errors', 'Conversion requests answered with an error status.', ('status',)))
+        self.upload_bytes = self.registry.register(Histogram(
+            'desmos_upload_bytes', 'Size of uploaded images.', buckets=SIZE_BUCKETS))
+        self.output_bytes = self.registry.register(Histogram(
+            'desmos_output_bytes', 'Bytes of output files written per conversion or lazy export.', ('mode',),
+            buckets=SIZE_BUCKETS))
+
+    def gauge(self, name, documentation, callback):
+        self.registry.register(Gauge(name, documentation, callback))
+
+    @staticmethod
+    def mode(params):
+        return 'contours_only' if params['contours_only'] else 'full'
+
+    def observe_conversion(self, params, payload):
+        """Record a finished conversion from the per-stage metrics in its payload."""
+        mode = self.mode(params)
+        self.conversions.inc(mode=mode, outcome='done')
+        metrics = payload.get('metrics') or {}
+        for record in metrics.get('stages', ()):
+            self.stage_duration.observe(record['wall_ms'] / 1000, stage=record['stage'])
+        totals = metrics.get('totals') or {}
+        if totals:
+            self.conversion_duration.observe(totals['wall_ms'] / 1000, mode=mode)
+            self.output_bytes.observe(totals['bytes_written'], mode=mode)
+
+    def observe_failure(self, params, cancelled=False):
+        self.conversions.inc(mode=self.mode(params), outcome='cancelled' if cancelled else 'failed')
+
+    def render(self):
+        return self.registry.render()
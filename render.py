@@ -0,0 +1,77 @@
+"""
+Rasterization backends for fitted curves.
+
+All backends sample every segment with one batched evaluation
+(``CurveSet.evaluate``) and differ only in how the polylines are drawn:
+
+- 'opencv':     direct anti-aliased ``cv2.polylines`` onto a NumPy canvas
+- 'collection': a single matplotlib ``LineCollection``
+- 'matplotlib': one ``ax.plot`` call per segment (the original path, kept as
+                a fallback)
+"""
+import cv2
+import numpy as np
+from matplotlib.collections import LineCollection
+
+
+BACKENDS = ('opencv', 'collection', 'matplotlib')
+DEFAULT_BACKEND = 'opencv'
+
+# Points sampled per segment when drawing
+SAMPLES_PER_SEGMENT = 50
+
+# Fixed-point fractional bits used for sub-pixel cv2.polylines coordinates
+_SHIFT = 4
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown render backend '{backend}', expected one of {BACKENDS}")
+    return backend
+
+
+def sample_curves(curves, samples=SAMPLES_PER_SEGMENT):
+    """Sample every segment; returns an array of shape (n_segments, samples, 2)."""
+    xs, ys = curves.evaluate(np.linspace(0, 1, samples))
+    return np.stack((xs, ys), axis=-1)
+
+
+def rasterize(curves, width, height, scale=1.0, color=(0, 0, 0), thickness=1,
+              flip_y=True, samples=SAMPLES_PER_SEGMENT):
+    """
+    Draw all segments onto a white BGR canvas with anti-aliased polylines.
+
+    Parameters:
+    - width, height: Size of the curve coordinate space (the source image)
+    - scale: Output pixels per coordinate unit
+    - color: BGR line color
+    - thickness: Line thickness in output pixels
+    - flip_y: Treat y as pointing up (the Desmos convention used by the fit)
+    """
+    out_w = max(1, int(round(width * scale)))
+    out_h = max(1, int(round(height * scale)))
+    canvas = np.full((out_h, out_w, 3), 255, dtype=np.uint8)
+    if len(curves) == 0:
+        return canvas
+
+    points = sample_curves(curves, samples)
+    if flip_y:
+        points[..., 1] = height - points[..., 1]
+    points *= scale * (1 << _SHIFT)
+    # Keep coordinates well inside int32 for runaway polynomials
+    np.clip(points, -(1 << 28), 1 << 28, out=points)
+    polylines = list(np.rint(points).astype(np.int32))
+    cv2.polylines(canvas, polylines, False, color, thickness=max(1, int(round(thickness))),
+                  lineType=cv2.LINE_AA, shift=_SHIFT)
+    return canvas
+
+
+def draw_on_axes(ax, curves, backend=DEFAULT_BACKEND, color='k', linewidth=0.5,
+                 samples=SAMPLES_PER_SEGMENT):
+    """Draw all segments on a matplotlib axes with the 'collection' or 'matplotlib' backend."""
+    points = sample_curves(curves, samples)
+    if backend == 'matplotlib':
+        for segment in points:
+            ax.plot(segment[:, 0], segment[:, 1], color=color, linestyle='-', linewidth=linewidth)
+    else:
+        ax.add_collection(LineCollection(points, colors=color, linewidths=linewidth))
@@ -0,0 +1,150 @@
+"""
+Working-resolution downscaling for the converter pipeline.
+
+Large uploads are processed on a pyramid-downscaled copy of the grayscale
+image. The affine map from working to image coordinates is tracked through
+every pyramid level, so contours and fitted polynomials can be mapped back
+exactly and exports keep the original image's size and viewport.
+
+``resolution_report`` runs the pipeline at native and working resolution and
+reports the time saved against the detail lost.
+"""
+import math
+import sys
+import time
+
+import cv2
+import numpy as np
+
+
+# (sx, ox, sy, oy) of a pipeline running at native resolution
+IDENTITY_TRANSFORM = (1.0, 0.0, 1.0, 0.0)
+
+
+def downscale(gray, max_pixels):
+    """
+    Downscale ``gray`` to at most ``max_pixels`` pixels.
+
+    Halves the image with ``cv2.pyrDown`` while that stays above the budget,
+    then resizes the rest of the way with ``INTER_AREA``.
+
+    Returns (small, transform) where ``transform = (sx, ox, sy, oy)`` maps a
+    working pixel (x, y) to image pixel (sx*x + ox, sy*y + oy).
+    """
+    sx, ox, sy, oy = IDENTITY_TRANSFORM
+    height, width = gray.shape[:2]
+    if height * width <= max_pixels:
+        return gray, IDENTITY_TRANSFORM
+
+    small = gray
+    while (small.shape[0] // 2) * (small.shape[1] // 2) >= max_pixels:
+        # pyrDown centres output pixel x on input pixel 2x
+        small = cv2.pyrDown(small)
+        sx, sy = 2 * sx, 2 * sy
+
+    h, w = small.shape[:2]
+    if h * w > max_pixels:
+        factor = math.sqrt(max_pixels / (h * w))
+        new_w, new_h = max(1, int(w * factor)), max(1, int(h * factor))
+        small = cv2.resize(small, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        # INTER_AREA: x_in = (x_out + 0.5) * w / new_w - 0.5
+        kx, ky = w / new_w, h / new_h
+        ox, oy = ox + sx * (kx - 1) / 2, oy + sy * (ky - 1) / 2
+        sx, sy = sx * kx, sy * ky
+    return small, (sx, ox, sy, oy)
+
+
+def contours_to_image(contours, transform):
+    """Map working-resolution contours to (rounded int32) image coordinates."""
+    if transform == IDENTITY_TRANSFORM:
+        return contours
+    sx, ox, sy, oy = transform
+    scale, shift = np.array([sx, sy]), np.array([ox, oy])
+    return [np.rint(c * scale + shift).astype(np.int32) for c in contours]
+
+
+def curve_coverage(reference, candidate, width, height, tolerance=2.0):
+    """
+    Share of ``reference``'s drawn pixels within ``tolerance`` pixels of
+    ``candidate``'s, and the mean distance of those pixels to ``candidate``.
+    """
+    from render import rasterize
+
+    ref = rasterize(reference, width, height)[..., 0] < 128
+    cand = rasterize(candidate, width, height)[..., 0] < 128
+    if not ref.any():
+        return 1.0, 0.0
+    if not cand.any():
+        return 0.0, float('inf')
+    distance = cv2.distanceTransform(np.where(cand, 0, 255).astype(np.uint8), cv2.DIST_L2, 3)[ref]
+    return float(np.mean(distance <= tolerance)), float(distance.mean())
+
+
+def resolution_report(image_path, max_working_pixels, segment_size=5, **edge_params):
+    """
+    Convert ``image_path`` at native and at working resolution and compare.
+
+    Returns a dict with both runs' times and contour/point/segment counts.
+    ``coverage`` is the share of native curve pixels within 2 px of the
+    working-resolution curves (detail kept), ``precision`` the share of
+    working curve pixels within 2 px of native ones (placement accuracy);
+    ``mean_error_px`` is the mean distance of native pixels to working curves.
+    """
+    from base import ImageToDesmosConverter
+
+    runs = {}
+    for name, limit in (('native', None), ('working', max_working_pixels)):
+        converter = ImageToDesmosConverter(image_path, stage_cache=None)
+        started = time.perf_counter()
+        converter.load_and_preprocess(max_working_pixels=limit)
+        converter.detect_edges(**edge_params)
+        converter.simplify_contours()
+        converter.fit_curves_parametric(segment_size=segment_size)
+        elapsed = time.perf_counter() - started
+        h, w = converter.gray.shape
+        runs[name] = {
+            'converter': converter,
+            'seconds': round(elapsed, 3),
+            'working_size': [w, h],
+            'contours': len(converter.contours),
+            'points': sum(len(c) for c in converter.contours),
+            'segments': len(converter.curves),
+        }
+
+    native, working = runs['native'].pop('converter'), runs['working'].pop('converter')
+    height, width = native.image.shape[:2]
+    coverage, mean_error = curve_coverage(native.curves, working.curves, width, height)
+    precision, _ = curve_coverage(working.curves, native.curves, width, height)
+    return {
+        'image': str(image_path),
+        'max_working_pixels': max_working_pixels,
+        'native': runs['native'],
+        'working': runs['working'],
+        'speedup': round(runs['native']['seconds'] / max(runs['working']['seconds'], 1e-9), 2),
+        'coverage': round(coverage, 4),
+        'precision': round(precision, 4),
+        'mean_error_px': round(mean_error, 3),
+    }
+
+
+def print_report(report):
+    print("\n" + "=" * 50)
+    print(f"Working resolution report: {report['image']}")
+    print("=" * 50)
+    print(f"{'':10}{'size':>14}{'time (s)':>10}{'contours':>10}{'points':>10}{'segments':>10}")
+    for name in ('native', 'working'):
+        run = report[name]
+        size = '×'.join(map(str, run['working_size']))
+        print(f"{name:10}{size:>14}{run['seconds']:>10}{run['contours']:>10}"
+              f"{run['points']:>10}{run['segments']:>10}")
+    print(f"Speedup: {report['speedup']}×")
+    print(f"Detail kept: {report['coverage']:.1%} of native curve pixels within 2px of working curves "
+          f"(mean distance {report['mean_error_px']} px)")
+    print(f"Placement: {report['precision']:.1%} of working curve pixels within 2px of native curves")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python resolution.py IMAGE [MAX_WORKING_PIXELS]")
+        sys.exit(1)
+    print_report(resolution_report(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000))
@@ -0,0 +1,132 @@
+"""
+Centerline extraction for line art.
+
+Canny finds both sides of every pen stroke, so a drawing's lines come back
+as two contours each. Skeleton mode instead thresholds the image into
+stroke pixels, thins the strokes to a 1-pixel skeleton (Zhang-Suen) and
+traces the skeleton into ordered open polylines: one per stroke, running
+down its middle.
+
+``cv2.ximgproc.thinning`` is used when opencv-contrib is installed; the
+NumPy fallback applies the same Zhang-Suen rules through a 256-entry lookup
+table of 8-neighbourhood codes.
+"""
+import cv2
+import numpy as np
+
+from stitching import JOIN_ANGLE, compress, trace_pixels
+
+
+# Junctions at most this many steps apart are treated as one crossing
+BRIDGE_STEPS = 8
+
+# Neighbours P2..P9 of the Zhang-Suen paper as (dy, dx), clockwise from north;
+# bit k of a neighbourhood code is neighbour P(k+2)
+_NEIGHBOURS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+
+def _zhang_suen_tables():
+    """Deletion tables of the two Zhang-Suen sub-iterations, indexed by neighbourhood code."""
+    tables = np.zeros((2, 256), dtype=bool)
+    for code in range(256):
+        p2, p3, p4, p5, p6, p7, p8, p9 = p = [(code >> k) & 1 for k in range(8)]
+        # 2..6 stroke neighbours, exactly one 0 -> 1 transition around the pixel
+        transitions = sum(p[k] == 0 and p[(k + 1) % 8] == 1 for k in range(8))
+        if not (2 <= sum(p) <= 6 and transitions == 1):
+            continue
+        tables[0, code] = p2 * p4 * p6 == 0 and p4 * p6 * p8 == 0
+        tables[1, code] = p2 * p4 * p8 == 0 and p2 * p6 * p8 == 0
+    return tables
+
+
+_DELETE = _zhang_suen_tables()
+
+
+def binarize(gray, threshold=None, blur_size=3):
+    """
+    Stroke mask of ``gray``.
+
+    Pixels darker than ``threshold`` (Otsu's threshold by default) are
+    strokes; if that selects most of the image, the drawing is taken to be
+    light on dark and the mask is inverted.
+    """
+    if blur_size > 0:
+        gray = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+    if threshold is None:
+        _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    else:
+        _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
+    if np.count_nonzero(mask) > mask.size // 2:
+        mask = cv2.bitwise_not(mask)
+    return mask
+
+
+def thin(mask):
+    """Zhang-Suen skeleton of a binary mask, as a uint8 0/255 image."""
+    if hasattr(cv2, 'ximgproc'):
+        return cv2.ximgproc.thinning(mask, thinningType=cv2.ximgproc.THINNING_ZHANGSUEN)
+
+    image = np.pad(mask > 0, 1).astype(np.uint8)
+    ys, xs = np.nonzero(image)
+    changed = True
+    while changed:
+        changed = False
+        for table in _DELETE:
+            # Codes of all remaining stroke pixels first, then delete in parallel
+            code = np.zeros(len(ys), dtype=np.uint8)
+            for bit, (dy, dx) in enumerate(_NEIGHBOURS):
+                code |= image[ys + dy, xs + dx] << bit
+            delete = table[code]
+            if delete.any():
+                image[ys[delete], xs[delete]] = 0
+                ys, xs = ys[~delete], xs[~delete]
+                changed = True
+    return image[1:-1, 1:-1] * np.uint8(255)
+
+
+def skeleton_steps(skeleton):
+    """
+    Edges between 8-connected skeleton pixels, as pixel-index pairs.
+
+    A diagonal step is skipped when the two pixels also connect through a
+    shared 4-neighbour, so corners don't form triangles (false junctions).
+    """
+    height, width = skeleton.shape
+    on = np.pad(skeleton > 0, 1)
+    ys, xs = np.nonzero(on[1:-1, 1:-1])
+
+    def at(dy, dx):
+        return on[ys + 1 + dy, xs + 1 + dx]
+
+    steps = (
+        ((0, 1), at(0, 1)),
+        ((1, 0), at(1, 0)),
+        ((1, 1), at(1, 1) & ~at(0, 1) & ~at(1, 0)),
+        ((1, -1), at(1, -1) & ~at(0, -1) & ~at(1, 0)),
+    )
+    index = ys * width + xs
+    u = np.concatenate([index[keep] for _, keep in steps])
+    v = np.concatenate([index[keep] + dy * width + dx for (dy, dx), keep in steps])
+    return u, v
+
+
+def trace_skeleton(skeleton, min_length=10.0, join_angle=JOIN_ANGLE):
+    """
+    Trace a 1-pixel skeleton into ordered polylines, one per stroke.
+
+    Branches meeting at a junction (or at two junctions up to
+    ``BRIDGE_STEPS`` apart) are joined where the stroke continues straight
+    through (see stitching.join_paths); polylines shorter than
+    ``min_length`` pixels (spurs and specks) are dropped.
+
+    Returns open int32 polylines shaped (n, 1, 2); loops end on their
+    first point.
+    """
+    u, v = skeleton_steps(skeleton)
+    polylines = trace_pixels(u, v, skeleton.shape[1], join_angle, BRIDGE_STEPS)
+    strokes = []
+    for points in polylines:
+        points = compress(points.astype(np.int32)).reshape(-1, 1, 2)
+        if cv2.arcLength(points, False) >= min_length:
+            strokes.append(points)
+    return strokes
@@ -0,0 +1,153 @@
+"""
+Stage-level memoization for the ImageToDesmosConverter pipeline.
+
+Each pipeline method is a stage whose cache key chains the key of the
+previous stage with the stage name and its bound parameters. The first key
+is the hash of the source image bytes. Changing one parameter therefore
+only misses the stage that takes it and the stages after it; everything
+upstream is restored from the cache.
+
+Stages (and exports decorated with ``reported``) also emit start/end
+progress events through ``ImageToDesmosConverter.progress_callback``.
+
+Cached snapshots share arrays with the converter. Stages always replace
+their output attributes instead of modifying them in place, so snapshots
+stay valid as long as callers treat converter state as read-only.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def chain_key(previous, name, params):
+    """Digest of the previous stage key, the stage name and its parameters."""
+    digest = hashlib.sha256((previous or '').encode())
+    digest.update(name.encode())
+    digest.update(json.dumps(params, sort_keys=True, default=repr).encode())
+    return digest.hexdigest()
+
+
+def _size_of(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_size_of(v) for v in value)
+    return getattr(value, 'nbytes', 0)
+
+
+class StageCache:
+    """
+    Thread-safe LRU store of stage snapshots, bounded by approximate size.
+
+    Parameters:
+    - max_bytes: Approximate memory budget for cached arrays
+    - max_entries: Maximum number of snapshots kept
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=64):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, snapshot):
+        size = sum(_size_of(v) for v in snapshot.values())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (snapshot, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+
+# Shared by every converter in the process unless one is passed explicitly
+default_stage_cache = StageCache()
+
+
+def stage(name, outputs):
+    """
+    Mark a converter method as a cached pipeline stage.
+
+    Parameters:
+    - name: Stage name, part of the cache key
+    - outputs: Converter attributes the stage produces; these are restored
+               on a cache hit instead of running the method
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = dict(list(bound.arguments.items())[1:])
+            key = chain_key(self._stage_key, name, params)
+
+            self._report(name, 'start')
+            cache = self.stage_cache
+            snapshot = cache.get(key) if cache is not None else None
+            if snapshot is not None:
+                for attr, value in snapshot.items():
+                    setattr(self, attr, value)
+                self._stage_key = key
+                logger.info(f"✓ Reused cached {name} stage")
+                self._report(name, 'end', cached=True)
+                return self
+
+            result = method(self, *args, **kwargs)
+            self._stage_key = key
+            if cache is not None:
+                cache.put(key, {attr: getattr(self, attr) for attr in outputs})
+            self._report(name, 'end', cached=False)
+            return result
+        return wrapper
+    return decorator
+
+
+def reported(name):
+    """
+    Report start/end progress events for an uncached converter step (exports).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            self._report(name, 'start')
+            result = method(self, *args, **kwargs)
+            self._report(name, 'end')
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,338 @@
+"""
+Contour stitching and deduplication before fitting.
+
+``findContours`` traces every 1-pixel Canny edge from both sides: open edges
+come back as contours that double back on themselves, closed edges as an
+outer and an inner contour over the same pixels, and touching edges as
+separate contours. Stitching rebuilds the edges as one undirected graph of
+pixel steps (the grid hash is the pixel index ``y * width + x``), so every
+step is kept once, and traces it into maximal polylines that run from
+junction to junction (or around a loop). Path ends are indexed by node, and
+ends that continue each other straight through a junction are joined into
+one stroke. Polylines lying along others, like the two sides of a thin
+stroke, are then found with a KD-tree: the shorter one is dropped and the
+longer one is pulled onto the centerline between them.
+
+Stitched contours are open polylines; loops repeat their first point at the
+end.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+# Polylines at most this far apart (pixels) count as the same stroke
+STROKE_DISTANCE = 3.0
+
+# Share of a polyline's pixels near a longer one for it to be dropped
+OVERLAP_THRESHOLD = 0.8
+
+# Path ends meeting at a junction are joined when the stroke turns by at most this (degrees)
+JOIN_ANGLE = 60.0
+
+# Pixels from a path end used to estimate its direction
+DIRECTION_SPAN = 5
+
+
+def pixel_steps(contours, closed=True):
+    """
+    Unit pixel steps along every edge of every contour.
+
+    ``CHAIN_APPROX_SIMPLE`` only compresses horizontal, vertical and diagonal
+    runs, so each edge expands exactly into ``max(|dx|, |dy|)`` unit steps
+    (other edges, like joins across a junction bridge, are rasterized).
+    ``closed`` adds the edge from each contour's last point to its first.
+    Returns (from, to) arrays of (x, y) pixel coordinates.
+    """
+    starts, ends = [], []
+    for contour in contours:
+        points = contour.reshape(-1, 2).astype(np.int64)
+        if len(points) < 2:
+            continue
+        if closed:
+            starts.append(points)
+            ends.append(np.roll(points, -1, axis=0))
+        else:
+            starts.append(points[:-1])
+            ends.append(points[1:])
+    if not starts:
+        empty = np.empty((0, 2), dtype=np.int64)
+        return empty, empty
+    a, b = np.concatenate(starts), np.concatenate(ends)
+    delta = b - a
+    n_steps = np.abs(delta).max(axis=1)
+    keep = n_steps > 0
+    a, delta, n_steps = a[keep], delta[keep], n_steps[keep]
+    step = np.arange(n_steps.sum()) - np.repeat(np.cumsum(n_steps) - n_steps, n_steps)
+    start = np.repeat(a, n_steps, axis=0)
+    delta = np.repeat(delta, n_steps, axis=0)
+    fraction = step / np.repeat(n_steps, n_steps)
+    origin = start + np.rint(delta * fraction[:, None]).astype(np.int64)
+    target = start + np.rint(delta * (fraction + 1 / np.repeat(n_steps, n_steps))[:, None]).astype(np.int64)
+    return origin, target
+
+
+def trace_graph(u, v, n_nodes):
+    """
+    Trace an undirected graph into maximal paths.
+
+    ``u``/``v`` are the (deduplicated) edge endpoints. Paths run between
+    nodes whose degree is not 2; cycles without such nodes are traced as
+    loops that end on their first node. Returns a list of node-id arrays.
+    """
+    degree = np.bincount(np.concatenate((u, v)), minlength=n_nodes)
+    # CSR adjacency: neighbours of node i are adjacent[offsets[i]:offsets[i+1]]
+    heads = np.concatenate((u, v))
+    tails = np.concatenate((v, u))
+    edge_ids = np.concatenate((np.arange(len(u)), np.arange(len(u))))
+    order = np.argsort(heads, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(heads, minlength=n_nodes)))).tolist()
+    neighbours = tails[order].tolist()
+    incident = edge_ids[order].tolist()
+    degree_list = degree.tolist()
+    used = [False] * len(u)
+
+    def walk(start, slot):
+        path = [start]
+        node = start
+        while True:
+            edge = incident[slot]
+            used[edge] = True
+            node = neighbours[slot]
+            path.append(node)
+            if degree_list[node] != 2 or node == start:
+                return path
+            first = offsets[node]
+            slot = first if incident[first] != edge else first + 1
+            if used[incident[slot]]:
+                return path
+
+    paths = []
+    for start in np.flatnonzero((degree > 0) & (degree != 2)).tolist():
+        for slot in range(offsets[start], offsets[start + 1]):
+            if not used[incident[slot]]:
+                paths.append(walk(start, slot))
+    for start in np.flatnonzero(degree == 2).tolist():
+        slot = offsets[start]
+        if not used[incident[slot]]:
+            paths.append(walk(start, slot))
+    return [np.array(path, dtype=np.int64) for path in paths]
+
+
+def end_directions(polylines, span=DIRECTION_SPAN):
+    """Unit vectors pointing out of the start and end of every polyline, shape (n, 2, 2)."""
+    directions = np.zeros((len(polylines), 2, 2))
+    for i, points in enumerate(polylines):
+        k = min(span, len(points) - 1)
+        directions[i, 0] = points[0] - points[k]
+        directions[i, 1] = points[-1] - points[-1 - k]
+    norms = np.linalg.norm(directions, axis=2, keepdims=True)
+    return directions / np.where(norms > 0, norms, 1)
+
+
+def join_paths(paths, polylines, max_turn=JOIN_ANGLE, bridge_steps=0):
+    """
+    Join paths that continue each other through a shared end node.
+
+    Ends meeting at a node are indexed by node id, with junctions at most
+    ``bridge_steps`` apart merged into one node (a thick crossing thins into
+    two junctions joined by a short bridge). At every node the pair of
+    ends pointing most nearly in opposite directions is joined first, as
+    long as the stroke turns by at most ``max_turn`` degrees. Returns the
+    joined polylines.
+    """
+    directions = end_directions(polylines)
+    open_paths = [i for i, path in enumerate(paths) if not (len(path) > 2 and path[0] == path[-1])]
+    n_ends = {}
+    for i in open_paths:
+        for node in (int(paths[i][0]), int(paths[i][-1])):
+            n_ends[node] = n_ends.get(node, 0) + 1
+
+    # Contract short bridges between junctions; a merged cluster may span at
+    # most bridge_steps pixels, so dense junctions (hatching) stay apart
+    merged, extent = {}, {}
+
+    def find(node):
+        while node in merged:
+            node = merged[node]
+        return node
+
+    bridges = set()
+    for i in open_paths:
+        a, b = int(paths[i][0]), int(paths[i][-1])
+        if len(paths[i]) - 1 > bridge_steps or a == b or n_ends[a] < 3 or n_ends[b] < 3:
+            continue
+        ra, rb = find(a), find(b)
+        if ra == rb:
+            continue
+        ends_a = extent.get(ra, (polylines[i][0], polylines[i][0]))
+        ends_b = extent.get(rb, (polylines[i][-1], polylines[i][-1]))
+        low = np.minimum(ends_a[0], ends_b[0])
+        high = np.maximum(ends_a[1], ends_b[1])
+        if (high - low).max() <= bridge_steps:
+            merged[rb] = ra
+            extent[ra] = (low, high)
+            bridges.add(i)
+
+    ends = {}
+    for i in open_paths:
+        if i not in bridges:
+            ends.setdefault(find(int(paths[i][0])), []).append(2 * i)
+            ends.setdefault(find(int(paths[i][-1])), []).append(2 * i + 1)
+
+    limit = -np.cos(np.radians(max_turn))
+    partner = {}
+    for members in ends.values():
+        if len(members) < 2:
+            continue
+        vectors = directions[np.array(members) // 2, np.array(members) % 2]
+        dots = vectors @ vectors.T
+        np.fill_diagonal(dots, np.inf)
+        free = set(range(len(members)))
+        for flat in np.argsort(dots, axis=None):
+            a, b = divmod(int(flat), len(members))
+            if dots[a, b] > limit:
+                break
+            if a in free and b in free and members[a] // 2 != members[b] // 2:
+                partner[members[a]] = members[b]
+                partner[members[b]] = members[a]
+                free -= {a, b}
+
+    joined, visited = [], [False] * len(polylines)
+    for first in range(len(polylines)):
+        if visited[first]:
+            continue
+        # Walk back to the start of the chain (or around a loop)
+        line, entry = first, 2 * first
+        while entry in partner and partner[entry] // 2 != first:
+            line = partner[entry] // 2
+            entry = (partner[entry] ^ 1)
+        # entry is the free end of the chain's first path; walk forward from it
+        pieces = []
+        while True:
+            visited[line] = True
+            points = polylines[line]
+            pieces.append(points if entry % 2 == 0 else points[::-1])
+            exit_end = entry ^ 1
+            if exit_end not in partner or visited[partner[exit_end] // 2]:
+                break
+            entry = partner[exit_end]
+            line = entry // 2
+        # Pieces share their end pixel unless they were joined across a bridge
+        joined.append(np.concatenate([pieces[0]] + [
+            p[1:] if np.array_equal(p[0], prev[-1]) else p for prev, p in zip(pieces, pieces[1:])]))
+    return joined
+
+
+def trace_pixels(u, v, width, join_angle=JOIN_ANGLE, bridge_steps=0):
+    """
+    Trace a graph over pixels into (x, y) polylines.
+
+    ``u``/``v`` are the pixel indices (``y * width + x``) of the edge
+    endpoints, each undirected edge listed once. Ends continuing each other
+    through a junction are joined unless ``join_angle`` is 0 (see join_paths).
+    """
+    if not len(u):
+        return []
+    # Renumber pixels to compact node ids
+    pixels, edges = np.unique(np.concatenate((u, v)), return_inverse=True)
+    edges = edges.reshape(2, -1)
+    paths = trace_graph(edges[0], edges[1], len(pixels))
+    nodes = pixels[np.concatenate(paths)]
+    splits = np.cumsum([len(path) for path in paths])[:-1]
+    polylines = np.split(np.column_stack((nodes % width, nodes // width)), splits)
+    if join_angle > 0:
+        polylines = join_paths(paths, polylines, join_angle, bridge_steps)
+    return polylines
+
+
+def compress(points):
+    """Drop interior points where the step direction does not change."""
+    if len(points) < 3:
+        return points
+    direction = np.sign(np.diff(points, axis=0))
+    turn = np.any(direction[1:] != direction[:-1], axis=1)
+    keep = np.concatenate(([True], turn, [True]))
+    return points[keep]
+
+
+def collapse_overlaps(polylines, distance=STROKE_DISTANCE, threshold=OVERLAP_THRESHOLD):
+    """
+    Drop polylines that run along longer ones and centre the survivors.
+
+    A polyline is dropped when at least ``threshold`` of its points lie
+    within ``distance`` of a longer polyline that is kept. Points of kept
+    polylines near dropped ones move halfway towards them, onto the
+    centerline of the stroke. Returns the surviving (float) polylines.
+    """
+    if len(polylines) < 2:
+        return polylines
+    lengths = np.array([len(p) for p in polylines])
+    owner = np.repeat(np.arange(len(polylines)), lengths)
+    points = np.concatenate(polylines).astype(np.float64)
+    pairs = cKDTree(points).query_pairs(distance, output_type='ndarray')
+    pairs = pairs[owner[pairs[:, 0]] != owner[pairs[:, 1]]]
+    if not len(pairs):
+        return polylines
+    # Both directions, sorted by first point (points are grouped by polyline)
+    pairs = np.concatenate((pairs, pairs[:, ::-1]))
+    pairs = pairs[np.argsort(pairs[:, 0], kind='stable')]
+    bounds = np.searchsorted(owner[pairs[:, 0]], np.arange(len(polylines) + 1))
+
+    dropped = np.zeros(len(polylines), dtype=bool)
+    absorbed = []
+    # Shortest first: a polyline can only be absorbed by a longer (or equal, later) one
+    for line in np.argsort(lengths, kind='stable'):
+        mine = pairs[bounds[line]:bounds[line + 1]]
+        other = owner[mine[:, 1]]
+        near = mine[(~dropped[other]) & (lengths[other] >= lengths[line])]
+        n_near = np.count_nonzero(np.diff(near[:, 0])) + 1 if len(near) else 0
+        if n_near >= threshold * lengths[line]:
+            dropped[line] = True
+            absorbed.append(near)
+
+    if absorbed:
+        absorbed = np.concatenate(absorbed)
+        absorbed = absorbed[~dropped[owner[absorbed[:, 1]]]]
+        # Mean position of the dropped neighbours of every kept point
+        target = np.zeros_like(points)
+        count = np.bincount(absorbed[:, 1], minlength=len(points))
+        np.add.at(target, absorbed[:, 1], points[absorbed[:, 0]])
+        moved = count > 0
+        points[moved] = (points[moved] + target[moved] / count[moved, None]) / 2
+
+    splits = np.cumsum(lengths)[:-1]
+    return [p for p, d in zip(np.split(points, splits), dropped) if not d]
+
+
+def stitch(contours, shape, distance=STROKE_DISTANCE, threshold=OVERLAP_THRESHOLD,
+           join_angle=JOIN_ANGLE, closed=True):
+    """
+    Merge, deduplicate and centre contours traced from a thin edge map.
+
+    Parameters:
+    - contours: OpenCV contours (closed, as returned by findContours) or
+                open polylines of unit-direction runs (``closed=False``)
+    - shape: (height, width) of the image the contours come from
+    - distance: Max distance in pixels between polylines of one stroke
+                (0 disables the overlap pass)
+    - threshold: Share of a polyline near a longer one for it to be dropped
+    - join_angle: Max turn in degrees for joining strokes through a
+                  junction (0 disables joining)
+    - closed: Whether the contours are closed
+
+    Returns open int32 polylines shaped (n, 1, 2); loops end on their
+    first point.
+    """
+    height, width = shape[:2]
+    a, b = pixel_steps(contours, closed)
+    if not len(a):
+        return []
+    u = a[:, 1] * width + a[:, 0]
+    v = b[:, 1] * width + b[:, 0]
+    # Each undirected step once
+    n_pixels = height * width
+    keys = np.unique(np.minimum(u, v) * n_pixels + np.maximum(u, v))
+    polylines = trace_pixels(keys // n_pixels, keys % n_pixels, width, join_angle)
+    if distance > 0:
+        polylines = collapse_overlaps(polylines, distance, threshold)
+    return [compress(np.rint(p).astype(np.int32)).reshape(-1, 1, 2) for p in polylines]
@@ -0,0 +1,120 @@
+"""
+Tiled, multi-threaded smoothing and Canny edge detection for large images.
+
+The grayscale image is split into tiles that overlap by a halo wide enough
+for the smoothing filter, the Sobel gradient and non-maximum suppression, so
+every tile computes exactly the values a full-frame pass would inside its
+core. Canny's hysteresis step is not local (a weak edge can be kept by a
+strong pixel anywhere along it), so each tile only reports its edge
+candidates and strong pixels; the stitched maps are then resolved globally
+by keeping the 8-connected candidate components that contain a strong pixel.
+The result is identical to ``cv2.Canny`` on the whole image.
+
+OpenCV releases the GIL, so tiles are processed in a thread pool.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+# Default tile edge length in pixels
+TILE_SIZE = 1024
+
+# Extra halo beyond the filter radius: 1 px for the Sobel kernel, 1 px for
+# non-maximum suppression, 1 px of margin
+_CANNY_HALO = 3
+
+
+def smoothing_radius(blur_size=3, use_bilateral=False, bilateral_d=9,
+                     bilateral_sigma_color=75, bilateral_sigma_space=75):
+    """Pixels of context the smoothing filter reads on each side."""
+    if use_bilateral:
+        # cv2.bilateralFilter derives the diameter from sigma_space when d <= 0
+        d = bilateral_d if bilateral_d > 0 else int(round(bilateral_sigma_space * 1.5)) * 2 + 1
+        return d // 2
+    return blur_size // 2 if blur_size > 0 else 0
+
+
+def smooth(gray, blur_size=3, use_bilateral=False, bilateral_d=9,
+           bilateral_sigma_color=75, bilateral_sigma_space=75):
+    """The smoothing applied before Canny (bilateral, Gaussian or none)."""
+    if use_bilateral:
+        return cv2.bilateralFilter(gray, d=bilateral_d, sigmaColor=bilateral_sigma_color,
+                                   sigmaSpace=bilateral_sigma_space)
+    if blur_size > 0:
+        return cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+    return gray
+
+
+def tile_grid(height, width, tile_size, halo):
+    """
+    Yield (core, padded) tile bounds as (y0, y1, x0, x1) tuples.
+
+    ``core`` tiles partition the image; ``padded`` extends each core by
+    ``halo`` pixels, clipped to the image.
+    """
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            y1, x1 = min(y0 + tile_size, height), min(x0 + tile_size, width)
+            yield ((y0, y1, x0, x1),
+                   (max(0, y0 - halo), min(height, y1 + halo),
+                    max(0, x0 - halo), min(width, x1 + halo)))
+
+
+def canny_tile(gray, bounds, low_threshold, high_threshold, **smoothing):
+    """
+    Canny maps of one tile from ``tile_grid``, computed on its padded bounds.
+
+    Returns (candidates, strong) for the tile's core: edge pixels with the
+    thresholds (low, low) and (high, high). Thresholds must be sorted.
+    """
+    (y0, y1, x0, x1), (py0, py1, px0, px1) = bounds
+    blurred = smooth(np.ascontiguousarray(gray[py0:py1, px0:px1]), **smoothing)
+    core = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+    # Canny(t, t) keeps every local maximum above t: with t = low these
+    # are the hysteresis candidates, with t = high the seeds
+    return (cv2.Canny(blurred, low_threshold, low_threshold)[core],
+            cv2.Canny(blurred, high_threshold, high_threshold)[core])
+
+
+def hysteresis(candidates, strong):
+    """Edge map of the 8-connected candidate components that touch a strong pixel."""
+    n_labels, labels = cv2.connectedComponents(candidates, connectivity=8)
+    keep = np.zeros(n_labels, dtype=bool)
+    keep[labels[strong > 0]] = True
+    keep[0] = False
+    return np.where(keep[labels], np.uint8(255), np.uint8(0))
+
+
+def canny_halo(**smoothing):
+    """Halo a tile needs so its core matches a full-frame Canny."""
+    return smoothing_radius(**smoothing) + _CANNY_HALO
+
+
+def tiled_canny(gray, low_threshold, high_threshold, tile_size=TILE_SIZE, workers=None,
+                **smoothing):
+    """
+    Smooth ``gray`` and run Canny on overlapping tiles in parallel.
+
+    ``smoothing`` takes the keyword arguments of ``smooth``. Returns the
+    uint8 edge map, identical to ``cv2.Canny(smooth(gray), ...)``.
+    """
+    # cv2.Canny swaps reversed thresholds too
+    low_threshold, high_threshold = sorted((low_threshold, high_threshold))
+    height, width = gray.shape
+    candidates = np.empty_like(gray)
+    strong = np.empty_like(gray)
+
+    def process(bounds):
+        y0, y1, x0, x1 = bounds[0]
+        candidates[y0:y1, x0:x1], strong[y0:y1, x0:x1] = canny_tile(
+            gray, bounds, low_threshold, high_threshold, **smoothing)
+
+    tiles = list(tile_grid(height, width, tile_size, canny_halo(**smoothing)))
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        list(pool.map(process, tiles))
+
+    # Global hysteresis: keep candidate components that touch a strong pixel
+    return hysteresis(candidates, strong)
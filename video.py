@@ -0,0 +1,355 @@
+"""
+Video and frame-sequence conversion into one animated Desmos graph.
+
+Frames are decoded one at a time with ``cv2.VideoCapture`` (a video file,
+or an image sequence pattern such as ``frames/img_%04d.png``) and only the
+work for what changed since the last frame is redone:
+
+- Every frame gets the grayscale conversion and CLAHE contrast enhancement
+  of ``ImageToDesmosConverter.load_and_preprocess`` (CLAHE is not local, so
+  it runs on the whole frame), then the enhanced frame is compared with a
+  reference image tile by tile. Tiles whose
+  largest pixel difference stays within ``change_threshold`` keep their
+  previous Canny maps; only changed tiles (and their neighbours, whose halo
+  reads them) are smoothed and edge-detected again and the changed tiles are
+  copied into the reference. The edge map stays identical to a full-frame
+  Canny of the reference (see tiling.py). A frame without changed tiles
+  costs the contrast enhancement and one absolute difference.
+- Contours are looked up by their exact points. A contour whose pixels did
+  not move is found in the cache with its fitted segments; only new
+  contours are simplified and fitted, in one batch per frame.
+
+Every contour shape is drawn for the frames it appears in. The result is a
+single graph state with a frame slider ``f``; each segment is restricted to
+``a \\le f \\le b`` for its runs of consecutive frames, so a static shape is
+one set of expressions however many frames it spans.
+
+Usage:
+    python video.py INPUT -o OUTPUT.json [--tile-size 64] [--change-threshold 8]
+                    [--step N] [--max-frames N] [--fit-tolerance PX] [--fit-degree D]
+                    [--max-working-megapixels MP] [--no-enhance-contrast]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from curves import CurveSet
+from exporters import graph_state_skeleton
+from fitting import fit_contours
+from formatting import CurveFormatter
+from resolution import IDENTITY_TRANSFORM, downscale
+from tiling import canny_halo, canny_tile, hysteresis, tile_grid
+
+logger = logging.getLogger(__name__)
+
+# Tile edge length for frame differencing and edge updates
+TILE_SIZE = 64
+
+# Largest per-pixel gray difference still treated as "unchanged"
+CHANGE_THRESHOLD = 8
+
+
+def _contour_key(contour):
+    return hashlib.blake2b(contour.tobytes(), digest_size=16).digest()
+
+
+class SequenceConverter:
+    """
+    Incremental converter for a stream of same-sized frames.
+
+    Feed frames in order with ``add_frame``; ``graph_state`` builds the
+    animated Desmos graph. Preprocessing, detection and fitting parameters
+    match ``ImageToDesmosConverter``'s, so the first frame's edges are those
+    of the frame converted as a still (without rotation).
+
+    Attributes:
+    - n_segments: Segments fitted so far
+    - frame_stats: One dict per frame: changed tiles, contours, contours
+      fitted (the rest were reused), new segments and wall time
+    """
+
+    def __init__(self, low_threshold=30, high_threshold=100, blur_size=3, min_contour_area=20,
+                 epsilon_factor=0.0001, segment_size=5, tolerance=None, degree=None,
+                 tile_size=TILE_SIZE, change_threshold=CHANGE_THRESHOLD, max_working_pixels=None,
+                 enhance_contrast=True):
+        self.low_threshold, self.high_threshold = sorted((low_threshold, high_threshold))
+        self.smoothing = {'blur_size': blur_size}
+        self.min_contour_area = min_contour_area
+        self.epsilon_factor = epsilon_factor
+        self.fit_options = {'segment_size': segment_size, 'tolerance': tolerance, 'degree': degree}
+        if tile_size <= canny_halo(**self.smoothing):
+            raise ValueError(f"tile_size must exceed the {canny_halo(**self.smoothing)} px Canny halo")
+        self.tile_size = tile_size
+        self.change_threshold = change_threshold
+        self.max_working_pixels = max_working_pixels
+        # As ImageToDesmosConverter._preprocess
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)) if enhance_contrast else None
+
+        self.n_frames = 0
+        self.frame_stats = []
+        self.image_size = None
+        self.working_transform = IDENTITY_TRANSFORM
+        self._reference = None
+        self._candidates = None
+        self._strong = None
+        self._tiles = None
+        # Contour key -> shape id; per shape its segment rows; shape id -> open run start
+        self._shapes = {}
+        self._shape_segments = []
+        self._active = {}
+        self._runs = []
+        self._coeff_parts = ([], [])
+        self._n_segments = 0
+        self._keys = []
+
+    def _working_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if self.image_size is None:
+            self.image_size = (gray.shape[1], gray.shape[0])
+        elif (gray.shape[1], gray.shape[0]) != self.image_size:
+            raise ValueError(f"Frame {self.n_frames} is {gray.shape[1]}×{gray.shape[0]}, "
+                             f"expected {self.image_size[0]}×{self.image_size[1]}")
+        if self._clahe is not None:
+            gray = self._clahe.apply(gray)
+        if self.max_working_pixels and gray.size > self.max_working_pixels:
+            gray, self.working_transform = downscale(gray, self.max_working_pixels)
+        return gray
+
+    def _changed_tiles(self, gray):
+        """
+        Boolean grid (tile rows x tile columns) of tiles whose pixels differ
+        from the reference by more than ``change_threshold``.
+        """
+        height, width = gray.shape
+        rows, cols = -(-height // self.tile_size), -(-width // self.tile_size)
+        if self._reference is None:
+            self._tiles = list(tile_grid(height, width, self.tile_size, canny_halo(**self.smoothing)))
+            self._reference = gray.copy()
+            self._candidates = np.zeros_like(gray)
+            self._strong = np.zeros_like(gray)
+            return np.ones((rows, cols), dtype=bool)
+        diff = np.zeros((rows * self.tile_size, cols * self.tile_size), dtype=np.uint8)
+        diff[:height, :width] = cv2.absdiff(gray, self._reference)
+        peaks = diff.reshape(rows, self.tile_size, cols, self.tile_size).max(axis=(1, 3))
+        return peaks > self.change_threshold
+
+    def _update_edges(self, gray, changed):
+        """Refresh the changed tiles of the reference and Canny maps; returns the contours."""
+        tiles = np.flatnonzero(changed)
+        for (y0, y1, x0, x1), _ in (self._tiles[t] for t in tiles):
+            self._reference[y0:y1, x0:x1] = gray[y0:y1, x0:x1]
+        # Neighbouring tiles read the changed pixels through their halo
+        if self.n_frames:
+            tiles = np.flatnonzero(cv2.dilate(changed.astype(np.uint8), np.ones((3, 3), np.uint8)))
+        for bounds in (self._tiles[t] for t in tiles):
+            y0, y1, x0, x1 = bounds[0]
+            self._candidates[y0:y1, x0:x1], self._strong[y0:y1, x0:x1] = canny_tile(
+                self._reference, bounds, self.low_threshold, self.high_threshold, **self.smoothing)
+        edges = hysteresis(self._candidates, self._strong)
+        contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        sx, _, sy, _ = self.working_transform
+        min_area = self.min_contour_area / (sx * sy)
+        return [c for c in contours if cv2.contourArea(c) > min_area]
+
+    def _fit_new(self, contours, keys, height):
+        """Simplify and fit contours seen for the first time; returns the new segment count."""
+        simplified = [cv2.approxPolyDP(c, self.epsilon_factor * cv2.arcLength(c, True), True)
+                      for c in contours]
+        contour_index, _, coeffs_x, coeffs_y = fit_contours(simplified, height, **self.fit_options)
+        curves = CurveSet(coeffs_x, coeffs_y, contour_index)
+        if self.working_transform != IDENTITY_TRANSFORM:
+            sx, ox, sy, oy = self.working_transform
+            curves = curves.affine(sx, ox, sy, self.image_size[1] - sy * height - oy)
+        self._coeff_parts[0].append(curves.coeffs_x)
+        self._coeff_parts[1].append(curves.coeffs_y)
+
+        counts = np.bincount(contour_index, minlength=len(contours))
+        starts = self._n_segments + np.concatenate(([0], np.cumsum(counts)[:-1]))
+        for key, start, count in zip(keys, starts, counts):
+            self._shapes[key] = len(self._shape_segments)
+            self._shape_segments.append((int(start), int(start + count)))
+        self._n_segments += len(curves)
+        return len(curves)
+
+    def add_frame(self, frame):
+        """Process the next frame (BGR or grayscale ndarray)."""
+        started = time.perf_counter()
+        gray = self._working_gray(frame)
+        changed = self._changed_tiles(gray)
+        stats = {'frame': self.n_frames, 'changed_tiles': int(changed.sum()),
+                 'contours': None, 'fitted': 0, 'new_segments': 0}
+
+        if changed.any():
+            contours = self._update_edges(gray, changed)
+            keys = list(dict.fromkeys(_contour_key(c) for c in contours))
+            by_key = {_contour_key(c): c for c in contours}
+            new = [key for key in keys if key not in self._shapes]
+            stats['fitted'] = len(new)
+            if new:
+                stats['new_segments'] = self._fit_new([by_key[k] for k in new], new, gray.shape[0])
+            self._keys = keys
+        stats['contours'] = len(self._keys)
+
+        # Extend the runs of shapes still visible, close the others
+        visible = {self._shapes[key] for key in self._keys}
+        for shape in [s for s in self._active if s not in visible]:
+            self._runs.append((shape, self._active.pop(shape), self.n_frames - 1))
+        for shape in visible:
+            self._active.setdefault(shape, self.n_frames)
+
+        stats['wall_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        self.frame_stats.append(stats)
+        self.n_frames += 1
+        return stats
+
+    @property
+    def n_segments(self):
+        return self._n_segments
+
+    def runs(self):
+        """(shape, first_frame, last_frame) of every run of consecutive frames, open runs included."""
+        return self._runs + [(shape, start, self.n_frames - 1) for shape, start in self._active.items()]
+
+    def curves(self):
+        """CurveSet of every segment fitted so far, in shape order."""
+        if not self._n_segments:
+            return CurveSet.empty()
+        width = max(part.shape[1] for part in self._coeff_parts[0])
+
+        def stack(parts):
+            return np.concatenate([np.pad(p, ((0, 0), (width - p.shape[1], 0))) for p in parts])
+        return CurveSet(stack(self._coeff_parts[0]), stack(self._coeff_parts[1]))
+
+    def graph_state(self, fps=None):
+        """
+        Desmos graph state with a frame slider ``f`` and every segment
+        restricted to the frames its shape is visible in.
+        """
+        width, height = self.image_size or (0, 0)
+        state = graph_state_skeleton(width, height)
+        expressions = state["expressions"]["list"]
+        slider = {"hardMin": True, "hardMax": True, "min": "0",
+                  "max": str(max(0, self.n_frames - 1)), "step": "1"}
+        if fps:
+            # Desmos animates sliders by their period in milliseconds per cycle
+            slider["animationPeriod"] = round(1000 * self.n_frames / fps)
+        expressions.append({"type": "expression", "id": "frame-slider",
+                            "latex": "f=0", "slider": slider})
+
+        x_exprs, y_exprs = CurveFormatter(self.curves()).render('latex')
+        for shape, first, last in sorted(self.runs(), key=lambda run: (run[1], run[0])):
+            if first == last:
+                condition = f"f={first}"
+            else:
+                condition = f"{first}\\le f\\le {last}"
+            start, stop = self._shape_segments[shape]
+            for i in range(start, stop):
+                expressions.append({
+                    "type": "expression",
+                    "id": f"curve-{shape}-{first}-{i}",
+                    "color": "#000000",
+                    "latex": f"\\left({x_exprs[i]},{y_exprs[i]}\\right)\\left\\{{{condition}\\right\\}}",
+                    "parametricDomain": {"min": "0", "max": "1"},
+                    "lineOpacity": "1",
+                    "lineWidth": "1"
+                })
+        return state
+
+
+def open_capture(source):
+    """``cv2.VideoCapture`` of a video file or image sequence pattern."""
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {source}")
+    return capture
+
+
+def iter_frames(source, step=1, max_frames=None):
+    """
+    Yield decoded frames of ``source`` (a path, pattern or open capture) one
+    at a time, keeping every ``step``-th. The capture is released at the end.
+    """
+    capture = source if isinstance(source, cv2.VideoCapture) else open_capture(source)
+    try:
+        yielded = 0
+        while max_frames is None or yielded < max_frames:
+            # Skipped frames are grabbed without decoding
+            for _ in range(step - 1):
+                if not capture.grab():
+                    return
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+            yielded += 1
+    finally:
+        capture.release()
+
+
+def convert_video(source, output, step=1, max_frames=None, **options):
+    """Convert ``source`` into a graph-state JSON file at ``output``. Returns the converter."""
+    capture = open_capture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or None
+
+    converter = SequenceConverter(**options)
+    for frame in iter_frames(capture, step, max_frames):
+        stats = converter.add_frame(frame)
+        logger.info(f"Frame {stats['frame']}: {stats['changed_tiles']} tiles changed, "
+                    f"{stats['fitted']}/{stats['contours']} contours fitted, "
+                    f"{stats['new_segments']} new segments ({stats['wall_ms']:.1f} ms)")
+    if converter.n_frames == 0:
+        raise ValueError(f"No frames decoded from {source}")
+
+    with open(output, 'w') as f:
+        json.dump(converter.graph_state(fps / step if fps else None), f, separators=(',', ':'))
+    total = sum(s['wall_ms'] for s in converter.frame_stats)
+    logger.info(f"✓ {converter.n_frames} frames, {converter.n_segments} segments in "
+                f"{len(converter.runs())} runs, {total / 1000:.2f}s; saved to {output}")
+    return converter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a video or frame sequence into an animated Desmos graph.")
+    parser.add_argument('input', help="Video file or image sequence pattern (e.g. frames/%%04d.png)")
+    parser.add_argument('-o', '--output', required=True, help="Graph-state JSON file to write")
+    parser.add_argument('--step', type=int, default=1, help="Keep every N-th frame")
+    parser.add_argument('--max-frames', type=int, default=None, help="Stop after this many frames")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help="Tile size for change detection")
+    parser.add_argument('--change-threshold', type=int, default=CHANGE_THRESHOLD,
+                        help="Gray-level difference a tile must exceed to be recomputed")
+    parser.add_argument('--low-threshold', type=int, default=30)
+    parser.add_argument('--high-threshold', type=int, default=100)
+    parser.add_argument('--blur-size', type=int, default=3)
+    parser.add_argument('--min-contour-area', type=int, default=20)
+    parser.add_argument('--epsilon-factor', type=float, default=0.0001)
+    parser.add_argument('--segment-size', type=int, default=5)
+    parser.add_argument('--fit-tolerance', type=float, default=None)
+    parser.add_argument('--fit-degree', type=int, default=None)
+    parser.add_argument('--max-working-megapixels', type=float, default=None)
+    parser.add_argument('--no-enhance-contrast', action='store_true',
+                        help="Skip the CLAHE contrast enhancement of still conversions")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    max_pixels = int(args.max_working_megapixels * 1_000_000) if args.max_working_megapixels else None
+    try:
+        convert_video(args.input, args.output, step=max(1, args.step), max_frames=args.max_frames,
+                      low_threshold=args.low_threshold, high_threshold=args.high_threshold,
+                      blur_size=args.blur_size, min_contour_area=args.min_contour_area,
+                      epsilon_factor=args.epsilon_factor, segment_size=args.segment_size,
+                      tolerance=args.fit_tolerance, degree=args.fit_degree,
+                      tile_size=args.tile_size, change_threshold=args.change_threshold,
+                      max_working_pixels=max_pixels, enhance_contrast=not args.no_enhance_contrast)
+    except ValueError as e:
+        parser.error(str(e))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())